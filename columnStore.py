@@ -0,0 +1,123 @@
+# local column store of every session's readings. Kept apart from mainFile.py so analysis code and
+# exportReadings.py only need numpy to read it, not the GUI, MongoDB or serial stack.
+import json
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+
+STORE_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("density", "<f8"),
+    ("viscosity", "<f8"),
+    ("tandelta", "<f8"),
+    ("temperature", "<f8"),
+    ("wearDebris", "<f8")
+])
+
+# local copy of every session's readings for analysis without MongoDB: one append-only file of fixed-size
+# STORE_DTYPE records per run, with a small JSON header beside it, under <directory>/<fluid key>/. The files are
+# memory-mapped as they are, so opening a fluid's history neither parses nor copies the readings.
+class ColumnStore:
+    def __init__(self, directory="readings"):
+        self.directory = directory
+        self.files = {}  # device id -> (run id, open file)
+
+    @staticmethod
+    def folder(directory, fluid_key):
+        return os.path.join(directory, re.sub(r"[^\w.-]", "_", fluid_key))
+
+    def append(self, session, frames, density, viscosity):
+        block = np.empty(len(frames), dtype=STORE_DTYPE)
+        block["timestamp"] = frames["timestamp"]
+        block["density"] = np.nan if density is None else density
+        block["viscosity"] = np.nan if viscosity is None else viscosity
+        block["tandelta"] = frames["tandelta"]
+        block["temperature"] = frames["temperature"]
+        block["wearDebris"] = frames["wearDebris"]
+        file = self.file_for(session)
+        file.write(block.tobytes())
+        file.flush()
+
+    def file_for(self, session):
+        current = self.files.get(session.device_id)
+        if current and current[0] == session.run_id:
+            return current[1]
+        if current:
+            current[1].close()
+
+        folder = self.folder(self.directory, session.fluid_key)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"{session.run_id}.json"), "w") as header:
+            json.dump({"FluidName": session.fluid_key, "TestTemperature": session.temperature,
+                       "DeviceId": session.device_id, "RunId": session.run_id,
+                       "Started": datetime.now().isoformat(timespec="seconds"), "dtype": STORE_DTYPE.descr}, header, indent=4)
+        file = open(os.path.join(folder, f"{session.run_id}.bin"), "ab")
+        self.files[session.device_id] = (session.run_id, file)
+        return file
+
+    def close(self):
+        for _, file in self.files.values():
+            file.close()
+        self.files = {}
+
+    def fluids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        names = set()
+        for folder in os.listdir(self.directory):
+            for header in self.headers(os.path.join(self.directory, folder)):
+                names.add(header["FluidName"])
+        return sorted(names)
+
+    @staticmethod
+    def headers(folder):
+        headers = []
+        for name in os.listdir(folder):
+            if name.endswith(".json"):
+                with open(os.path.join(folder, name), "r") as file:
+                    headers.append(json.load(file))
+        return sorted(headers, key=lambda header: header["Started"])
+
+    # (header, read-only memmap) per run, oldest first; a record torn by a crash at the end of a file is left out
+    def runs(self, fluid_key):
+        folder = self.folder(self.directory, fluid_key)
+        if not os.path.isdir(folder):
+            return []
+        runs = []
+        for header in self.headers(folder):
+            if header["FluidName"] != fluid_key:
+                continue
+            path = os.path.join(folder, f"{header['RunId']}.bin")
+            count = os.path.getsize(path) // STORE_DTYPE.itemsize if os.path.exists(path) else 0
+            readings = np.memmap(path, dtype=STORE_DTYPE, mode="r", shape=(count,)) if count else np.empty(0, dtype=STORE_DTYPE)
+            runs.append((header, readings))
+        return runs
+
+    # every reading of a fluid between start and end (datetimes or epoch seconds); a single run stays a memmap view
+    def history(self, fluid_key, start=None, end=None):
+        start = start.timestamp() if isinstance(start, datetime) else start
+        end = end.timestamp() if isinstance(end, datetime) else end
+        parts = []
+        for _, readings in self.runs(fluid_key):
+            # readings are appended in arrival order, so a range is a slice
+            low = 0 if start is None else np.searchsorted(readings["timestamp"], start, side="left")
+            high = len(readings) if end is None else np.searchsorted(readings["timestamp"], end, side="left")
+            if high > low:
+                parts.append(readings[low:high])
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=STORE_DTYPE)
+
+    def dataframe(self, fluid_key, start=None, end=None):
+        try:
+            import pandas as pd
+        except ImportError:
+            raise RuntimeError("Opening readings as a DataFrame needs the pandas package")
+
+        readings = self.history(fluid_key, start, end)
+        frame = pd.DataFrame({name: readings[name] for name in STORE_DTYPE.names if name != "timestamp"})
+        frame.index = pd.to_datetime(readings["timestamp"], unit="s", utc=True)
+        frame.index.name = "timestamp"
+        return frame
@@ -0,0 +1,99 @@
+# exports readings from the local column store (ColumnStore in columnStore.py) without MongoDB.
+# usage: python exportReadings.py --list
+#        python exportReadings.py oil-40 [--start 2024-01-01T00:00] [--end 2024-02-01T00:00] [--format csv|parquet|npy] [--output oil.csv]
+# for analysis in Python use the store directly: ColumnStore("readings").dataframe("oil-40")
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from columnStore import STORE_DTYPE, ColumnStore
+
+COLUMNS = {
+    "timestamp": "Timestamp",
+    "density": "Density",
+    "viscosity": "Viscosity",
+    "tandelta": "Tandelta",
+    "temperature": "Temperature",
+    "wearDebris": "WearDebris"
+}
+
+
+def export_csv(readings, path, chunk=100000):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS.values())
+        # chunked so a memory-mapped history is never copied whole
+        for start in range(0, len(readings), chunk):
+            block = readings[start:start + chunk]
+            times = [datetime.fromtimestamp(value).isoformat(sep=" ") for value in block["timestamp"].tolist()]
+            values = [block[name].tolist() for name in STORE_DTYPE.names[1:]]
+            writer.writerows(zip(times, *[["" if math.isnan(value) else value for value in column] for column in values]))
+
+
+def export_parquet(readings, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("Parquet export needs the pyarrow package")
+
+    columns = {"Timestamp": pa.array((readings["timestamp"] * 1e6).astype("int64"), type=pa.timestamp("us", tz="UTC"))}
+    columns.update({COLUMNS[name]: pa.array(np.ascontiguousarray(readings[name])) for name in STORE_DTYPE.names[1:]})
+    pq.write_table(pa.table(columns), path)
+
+
+# the store directory from settings.json, read directly so the export does not start the application's setup
+def store_directory(path="settings.json"):
+    try:
+        with open(path, "r") as file:
+            return json.load(file).get("columnStore", {}).get("directory", "readings")
+    except (FileNotFoundError, json.JSONDecodeError):
+        return "readings"
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export readings from the local column store")
+    parser.add_argument("fluid", nargs="?", help="fluid entry, as in the reports list (name-temperature)")
+    parser.add_argument("--list", action="store_true", help="list the fluids in the store")
+    parser.add_argument("--directory", default=store_directory())
+    parser.add_argument("--start", help="ISO date/time, inclusive")
+    parser.add_argument("--end", help="ISO date/time, exclusive")
+    parser.add_argument("--format", choices=("csv", "parquet", "npy"), default="csv")
+    parser.add_argument("--output", help="defaults to <fluid>.<format>")
+    args = parser.parse_args()
+
+    store = ColumnStore(args.directory)
+    if args.list:
+        for fluid in store.fluids():
+            runs = store.runs(fluid)
+            print(f"{fluid}: {sum(len(readings) for _, readings in runs)} readings in {len(runs)} runs")
+        return
+    if not args.fluid:
+        parser.error("give a fluid or --list")
+
+    readings = store.history(args.fluid, parse_time(args.start), parse_time(args.end))
+    if not len(readings):
+        sys.exit(f"No readings for {args.fluid} in {os.path.abspath(args.directory)}")
+
+    output = args.output or f"{args.fluid}.{args.format}"
+    if args.format == "csv":
+        export_csv(readings, output)
+    elif args.format == "parquet":
+        export_parquet(readings, output)
+    else:
+        np.save(output, np.asarray(readings))
+    print(f"Exported {len(readings)} readings to {output}")
+
+
+if __name__ == "__main__":
+    main()
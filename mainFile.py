@@ -1,19 +1,433 @@
-from PyQt5.QtWidgets import QMainWindow, QApplication, QMessageBox, QStackedWidget, QDialog, QButtonGroup
-from PyQt5.uic import loadUi
-from PyQt5.QtGui import QPixmap, QIcon
-from PyQt5.QtCore import QThread, pyqtSignal, QSize, Qt, QStandardPaths
+from PyQt5.QtWidgets import QMainWindow, QApplication, QMessageBox, QStackedWidget, QDialog, QButtonGroup, QLabel, QTabWidget, QShortcut, QVBoxLayout, QPlainTextEdit, QPushButton, QProgressDialog
+from PyQt5.QtGui import QPixmap, QIcon, QImageReader, QPainter, QPixmapCache, QKeySequence
+from PyQt5.QtCore import QThread, pyqtSignal, QSize, Qt, QStandardPaths, QObject, QElapsedTimer, QDateTime, QPoint, QRect
 import sys
 import json
-from PyQt5.QtCore import QTimer, QEventLoop
+from PyQt5.QtCore import QTimer
 import time
 import serial
 import serial.tools.list_ports
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
-from datetime import datetime
-import pandas as pd
+import numpy as np
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import BulkWriteError, PyMongoError, OperationFailure
+from bson import ObjectId
+import bson
+from datetime import datetime, timedelta
 import os
-import tkinter as tk
+import csv
+import sqlite3
+import math
+import queue
+import struct
+import heapq
+import itertools
+import threading
+import importlib.util
+import bisect
+import logging
+import pickle
+import shutil
+import hashlib
+import collections
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from columnStore import ColumnStore
+
+DEFAULT_SETTINGS = {
+    "serial": {
+        "baudRate": 9600,
+        "frameFormat": "csv",
+        "binaryRequest": "B",
+        "binaryAck": "BIN",
+        "maxInFlight": 1,
+        "commandTimeoutMs": 1000,
+        "reconnectInitialMs": 500,
+        "reconnectMaxMs": 10000,
+        "portPollIntervalMs": 1000,
+        "ports": [],
+        "statusIntervalMs": 1000
+    },
+    "database": {
+        "timeSeries": False
+    },
+    "mongoWriter": {
+        "batchSize": 200,
+        "flushIntervalMs": 1000,
+        "maxQueue": 10000
+    },
+    "spool": {
+        "directory": "spool",
+        "segmentBytes": 4194304,
+        "retryIntervalMs": 5000
+    },
+    "fluidRegistry": {
+        "path": "fluidData.db",
+        "legacyPath": "fluidData.json"
+    },
+    "reports": {
+        "batchSize": 5000
+    },
+    "display": {
+        "refreshIntervalMs": 100,
+        "maxFps": 10
+    },
+    "trends": {
+        "enabled": True,
+        "capacity": 36000,
+        "maxPoints": 600,
+        "height": 120
+    },
+    "startup": {
+        "uiCacheDirectory": "__uicache__",
+        "mainPageDelayMs": 500
+    },
+    "assets": {
+        "cacheLimitKb": 16384,
+        "useResources": True
+    },
+    "metrics": {
+        "enabled": True,
+        "host": "127.0.0.1",
+        "port": 9108
+    },
+    "logging": {
+        "level": "INFO",
+        "burst": 5,
+        "windowMs": 60000
+    },
+    "process": {
+        "pollIntervalMs": 1000,
+        "commandTimeoutMs": 5000,
+        "drainTimeoutMs": 180000,
+        "fillTimeoutMs": 180000,
+        "coolTimeoutMs": 900000,
+        "confirmTimeoutMs": 15000,
+        "coolBelow": 50,
+        "maxTemperature": 120
+    },
+    "reportCache": {
+        "enabled": True,
+        "directory": "__reportcache__",
+        "maxMb": 512,
+        "checkDays": 7
+    },
+    "archive": {
+        "enabled": True,
+        "compactAfterDays": 7,
+        "rawRetentionDays": 90,
+        "minuteRetentionDays": 730,
+        "chunkHours": 24,
+        "intervalMs": 3600000
+    },
+    "columnStore": {
+        "enabled": True,
+        "directory": "readings"
+    },
+    "oilProbe": {
+        "pollIntervalMs": 1000,
+        "timeoutMs": 15000,
+        "maxRetries": 3
+    }
+}
+
+# settings.json overrides the defaults section by section
+def load_settings(path="settings.json"):
+    settings = {section: dict(values) for section, values in DEFAULT_SETTINGS.items()}
+    try:
+        with open(path, "r") as file:
+            data = json.load(file)
+        for section, values in data.items():
+            if isinstance(values, dict):
+                settings.setdefault(section, {}).update(values)
+            else:
+                settings[section] = values
+    except (FileNotFoundError, json.JSONDecodeError):
+        print('Error reading the settings file, using defaults')
+    return settings
+
+SETTINGS = load_settings()
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+# counters, histograms and sampled gauges, rendered in the Prometheus text format.
+# metrics are looked up once and kept by the caller, so the hot path only takes one small lock.
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}  # name -> [type, help, {labels: metric or gauge function}]
+
+    def get(self, kind, name, help, labels, create):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.setdefault(name, [kind, help, {}])
+            if key not in family[2] or callable(family[2][key]):
+                family[2][key] = create()
+            return family[2][key]
+
+    def counter(self, name, help, **labels):
+        return self.get("counter", name, help, labels, Counter)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, **labels):
+        return self.get("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    # sampled when scraped; kind="counter" for totals that are already kept elsewhere
+    def gauge(self, name, help, function, kind="gauge", **labels):
+        self.get(kind, name, help, labels, lambda: function)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            families = [(name, kind, help, list(metrics.items())) for name, (kind, help, metrics) in sorted(self.families.items())]
+
+        for name, kind, help, metrics in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in metrics:
+                labels = ",".join(f'{label}="{value}"' for label, value in key)
+                series = f"{{{labels}}}" if labels else ""
+                if callable(metric):
+                    try:
+                        lines.append(f"{name}{series} {metric()}")
+                    except Exception:
+                        pass
+                elif kind == "counter":
+                    lines.append(f"{name}{series} {metric.value}")
+                else:
+                    with metric.lock:
+                        counts, total, count = list(metric.counts), metric.sum, metric.count
+                    cumulative = 0
+                    for bound, bucketCount in zip(metric.buckets + ("+Inf",), counts):
+                        cumulative += bucketCount
+                        separator = "," if labels else ""
+                        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{series} {total}")
+                    lines.append(f"{name}_count{series} {count}")
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+
+# GET /metrics on a local port for Prometheus (or curl) to scrape
+def start_metrics_server(host, port, registry=METRICS):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics available on http://{host}:{port}/metrics")
+    return server
+
+LOGGER = logging.getLogger("iocl")
+
+# at most `burst` messages per event every window; the next one that gets through says how many were dropped
+class RateLimiter:
+    def __init__(self, burst=5, window=60.0):
+        self.burst = burst
+        self.window = window
+        self.lock = threading.Lock()
+        self.events = {}  # event -> [window start, sent, suppressed]
+
+    def allow(self, event):
+        now = time.monotonic()
+        with self.lock:
+            state = self.events.get(event)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self.events[event] = [now, 1, 0]
+                return True, suppressed
+            if state[1] < self.burst:
+                state[1] += 1
+                return True, 0
+            state[2] += 1
+            return False, 0
+
+LOG_LIMITER = RateLimiter(SETTINGS["logging"]["burst"], SETTINGS["logging"]["windowMs"] / 1000)
+
+# hot-path messages go through here instead of print(): "event key=value ..." and rate limited per event
+def log_event(level, event, **fields):
+    if not LOGGER.isEnabledFor(level):
+        return
+    allowed, suppressed = LOG_LIMITER.allow(event)
+    if not allowed:
+        return
+    if suppressed:
+        fields["suppressed"] = suppressed
+    LOGGER.log(level, "%s %s", event, " ".join(f"{key}={value!r}" for key, value in fields.items()))
+
+# .ui files are compiled with pyuic5 once and the generated module is reused until the .ui changes
+def load_ui(ui_path, widget):
+    cacheDirectory = SETTINGS["startup"]["uiCacheDirectory"]
+    moduleName = "ui_" + os.path.splitext(os.path.basename(ui_path))[0]
+    modulePath = os.path.join(cacheDirectory, moduleName + ".py")
+
+    if not os.path.exists(modulePath) or os.path.getmtime(modulePath) < os.path.getmtime(ui_path):
+        from PyQt5.uic import compileUi
+        os.makedirs(cacheDirectory, exist_ok=True)
+        tempPath = modulePath + ".part"
+        with open(ui_path, "r", encoding="utf-8") as uiFile, open(tempPath, "w", encoding="utf-8") as pyFile:
+            compileUi(uiFile, pyFile)
+        os.replace(tempPath, modulePath)
+
+    spec = importlib.util.spec_from_file_location(moduleName, modulePath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    uiClass = next(value for name, value in vars(module).items() if name.startswith("Ui_"))
+
+    # expose the child widgets on the widget itself, the same way uic.loadUi does
+    ui = uiClass()
+    ui.setupUi(widget)
+    for name, value in vars(ui).items():
+        setattr(widget, name, value)
+    return ui
+
+# images come from the compiled Qt resource (pyrcc5 Assets/assets.qrc -o assets_rc.py) when it is there
+RESOURCES_LOADED = None
+
+def asset_path(name):
+    global RESOURCES_LOADED
+    if RESOURCES_LOADED is None:
+        RESOURCES_LOADED = False
+        if SETTINGS["assets"]["useResources"]:
+            try:
+                import assets_rc
+                RESOURCES_LOADED = True
+            except ImportError:
+                pass
+    return (":/images/" if RESOURCES_LOADED else "Assets/Images/") + name
+
+# decoded, pre-scaled pixmaps keyed by (name, size, device pixel ratio); QPixmapCache evicts the least recently used
+def cached_pixmap(name, width, height):
+    ratio = QApplication.instance().devicePixelRatio()
+    key = f"{name}@{width}x{height}@{ratio}"
+    pixmap = QPixmapCache.find(key)
+    if pixmap is None:
+        reader = QImageReader(asset_path(name))
+        reader.setScaledSize(reader.size().scaled(round(width * ratio), round(height * ratio), Qt.KeepAspectRatio))
+        pixmap = QPixmap.fromImage(reader.read())
+        pixmap.setDevicePixelRatio(ratio)
+        QPixmapCache.insert(key, pixmap)
+    return pixmap
+
+# the centred, size-sized part of a background image (what background-position: center shows);
+# only that region is decoded
+def cover_pixmap(name, size):
+    ratio = QApplication.instance().devicePixelRatio()
+    key = f"{name}@cover{size.width()}x{size.height()}@{ratio}"
+    pixmap = QPixmapCache.find(key)
+    if pixmap is None:
+        reader = QImageReader(asset_path(name))
+        imageSize = reader.size()
+        clip = QRect(0, 0, round(size.width() * ratio), round(size.height() * ratio))
+        clip.moveCenter(QPoint(imageSize.width() // 2, imageSize.height() // 2))
+        reader.setClipRect(clip.intersected(QRect(QPoint(0, 0), imageSize)))
+        pixmap = QPixmap.fromImage(reader.read())
+        pixmap.setDevicePixelRatio(ratio)
+        QPixmapCache.insert(key, pixmap)
+    return pixmap
+
+def paint_cover(widget, name):
+    cover = cover_pixmap(name, widget.size())
+    target = QRect(QPoint(0, 0), cover.size() / cover.devicePixelRatio())
+    target.moveCenter(widget.rect().center())
+    QPainter(widget).drawPixmap(target.topLeft(), cover)
+
+# runs a blocking call off the GUI thread and hands the result back through a signal
+class BackgroundTask(QThread):
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, function, parent=None):
+        super(BackgroundTask, self).__init__(parent)
+        self.function = function
+
+    def run(self):
+        try:
+            result = self.function()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.done.emit(result)
+
+MEASUREMENT_FIELDS = ("Density", "Viscosity", "Tandelta", "WearDebris")
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# readings are stored as doubles; "N/A", empty labels and NaN become null
+def to_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+# reports filter on FluidName and sort/range on Timestamp
+def prepare_fluid_collection(db, time_series=False):
+    if time_series and 'fluidCollection' not in db.list_collection_names():
+        # time-series collections do not enforce unique _id, so spool replays are only idempotent on a plain collection
+        db.create_collection('fluidCollection', timeseries={
+            "timeField": "Timestamp",
+            "metaField": "FluidName",
+            "granularity": "seconds"
+        })
+    collection = db['fluidCollection']
+    try:
+        collection.create_index([("FluidName", ASCENDING), ("Timestamp", ASCENDING)], name="FluidName_Timestamp")
+    except OperationFailure as e:
+        print(f"Error creating the fluidCollection index: {e}")
+    return collection
+
+# (device, id) for every USB serial adapter; the id is the adapter's serial number when it reports one
+def find_usb_ports():
+    return [(port.device, port.serial_number or os.path.basename(port.device))
+            for port in serial.tools.list_ports.comports() if 'USB' in port.description]
+
+# one analyser rig: its port, serial engine and, once built, its page
+class Analyser:
+    def __init__(self, device_id, port_name):
+        self.device_id = device_id
+        self.port_name = port_name
+        self.serial_connection = None
+        self.serial_engine = None
+        self.connected = True
+        self.page = None
 
 class MainUI(QMainWindow):
     def __init__(self):
@@ -21,39 +435,143 @@ class MainUI(QMainWindow):
         self.stackedWidget = QStackedWidget(self)
         self.setCentralWidget(self.stackedWidget)
         self.setWindowTitle('IOCL Software')
-        self.setWindowIcon(QIcon('Assets/Images/xymaIcon.png'))
+        self.setWindowIcon(QIcon(asset_path('xymaIcon.png')))
+        QPixmapCache.setCacheLimit(SETTINGS["assets"]["cacheLimitKb"])
         
         self.client = None
+        self.analysers = []
 
         self.collection = None
+        self.mongo_writer = None
+        self.archive = None
+        self.archive_compactor = None
+        self.database_task = None
+        self.port_task = None
+        self.port_watcher = None
+
+        metricsSettings = SETTINGS["metrics"]
+        self.metrics_server = start_metrics_server(metricsSettings["host"], metricsSettings["port"]) if metricsSettings["enabled"] else None
+        # hidden diagnostics page: the same metrics the endpoint serves
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, self.show_diagnostics)
+
+        # the window paints first; the database and the serial port come up in the background
+        self.databaseStatusLabel = QLabel('Database: connecting...')
+        self.serialStatusLabel = QLabel('Analysers: searching...')
+        self.statusBar().addPermanentWidget(self.databaseStatusLabel)
+        self.statusBar().addPermanentWidget(self.serialStatusLabel)
+
         self.setup_mongodb()
+
+        registrySettings = SETTINGS["fluidRegistry"]
+        self.fluid_registry = FluidRegistry(registrySettings["path"], registrySettings["legacyPath"])
+        storeSettings = SETTINGS["columnStore"]
+        self.column_writer = ColumnStoreWriter(ColumnStore(storeSettings["directory"])) if storeSettings["enabled"] else None
+        if self.column_writer:
+            self.column_writer.start()
+        cacheSettings = SETTINGS["reportCache"]
+        self.report_cache = ReportCache(cacheSettings["directory"], cacheSettings["maxMb"] * 2 ** 20,
+                                        timedelta(days=cacheSettings["checkDays"])) if cacheSettings["enabled"] else None
         
         self.loginPage = LoginUI(self, serial_connection = None)
-        self.mainPage = MainPageUI(self, collection = self.collection, serial_connection = None)
+        # the analyser pages are the expensive ones to build; they are created once the login page is up
+        self.mainTabs = None
 
         self.stackedWidget.addWidget(self.loginPage)
-        self.stackedWidget.addWidget(self.mainPage)
         
         self.stackedWidget.setCurrentWidget(self.loginPage)
 
         self.showMaximized()
+        QTimer.singleShot(SETTINGS["startup"]["mainPageDelayMs"], self.ensure_main_page)
 
         self.stackedWidget.currentChanged.connect(self.on_page_changed)
 
         self.check_serial_port()
         
+    # one MainPageUI tab per analyser; the tab bar only shows up with more than one rig
+    def ensure_main_page(self):
+        if self.mainTabs is None:
+            self.mainTabs = QTabWidget(self)
+            self.mainTabs.setTabBarAutoHide(True)
+            self.mainTabs.setDocumentMode(True)
+            self.stackedWidget.addWidget(self.mainTabs)
+
+        for analyser in self.analysers:
+            if analyser.page is None:
+                analyser.page = MainPageUI(self, collection = self.collection, serial_connection = None,
+                                           mongo_writer = self.mongo_writer, fluid_registry = self.fluid_registry,
+                                           column_writer = self.column_writer,
+                                           device_id = analyser.device_id)
+                analyser.page.set_serial_engine(analyser.serial_connection, analyser.serial_engine)
+                self.mainTabs.addTab(analyser.page, f"{analyser.device_id} ({analyser.port_name})")
+        return self.mainTabs
+
+    def show_diagnostics(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Diagnostics')
+        layout = QVBoxLayout(dialog)
+        text = QPlainTextEdit(METRICS.render(), dialog)
+        text.setReadOnly(True)
+        layout.addWidget(text)
+        dialog.resize(800, 600)
+        dialog.exec_()
+
     def setup_mongodb(self):
-        try:
-            self.client = MongoClient("mongodb://localhost:27017", serverSelectionTimeoutMS=5000)
-            db = self.client['IOCLDatabase']
-            self.collection = db['fluidCollection']
-            
+        # MongoClient connects lazily, so only the ping and the index setup need a thread
+        self.client = MongoClient("mongodb://localhost:27017", serverSelectionTimeoutMS=5000)
+        db = self.client['IOCLDatabase']
+        fluidCollection = db['fluidCollection']
+
+        def connect():
             self.client.admin.command('ping')
-            print('Connected to MongoDB!')
-            
-        except ServerSelectionTimeoutError:
-            QMessageBox.warning(self, 'Database Connection Error', 'Failed to connect to the MongoDB server!')
-            self.collection = None 
+            collection = prepare_fluid_collection(db, SETTINGS["database"]["timeSeries"])
+            archiveSettings = SETTINGS["archive"]
+            if not archiveSettings["enabled"]:
+                return collection, None
+            archive = FluidArchive(db, collection,
+                                   compact_after_days=archiveSettings["compactAfterDays"],
+                                   raw_retention_days=archiveSettings["rawRetentionDays"],
+                                   minute_retention_days=archiveSettings["minuteRetentionDays"],
+                                   chunk_hours=archiveSettings["chunkHours"],
+                                   time_series=SETTINGS["database"]["timeSeries"])
+            archive.prepare()
+            return collection, archive
+
+        self.database_task = BackgroundTask(connect, self)
+        self.database_task.done.connect(self.on_database_ready)
+        self.database_task.failed.connect(self.on_database_failed)
+        self.database_task.start()
+
+        # readings are spooled locally while the server is down and replayed when it comes back
+        writerSettings = SETTINGS["mongoWriter"]
+        spoolSettings = SETTINGS["spool"]
+        self.mongo_writer = MongoWriter(fluidCollection,
+                                        batch_size=writerSettings["batchSize"],
+                                        flush_interval=writerSettings["flushIntervalMs"] / 1000,
+                                        max_queue=writerSettings["maxQueue"],
+                                        spool=ReadingSpool(spoolSettings["directory"], spoolSettings["segmentBytes"]),
+                                        retry_interval=spoolSettings["retryIntervalMs"] / 1000,
+                                        available=False)
+        self.mongo_writer.next_retry = time.monotonic() + self.mongo_writer.retry_interval
+        self.mongo_writer.start()
+
+    def on_database_ready(self, result):
+        print('Connected to MongoDB!')
+        collection, self.archive = result
+        self.collection = collection
+        if self.archive:
+            self.archive_compactor = ArchiveCompactor(self.archive, SETTINGS["archive"]["intervalMs"] / 1000, self)
+            self.archive_compactor.start()
+        for analyser in self.analysers:
+            if analyser.page:
+                analyser.page.collection = collection
+        # let the writer pick the connection up (and replay its spool) straight away
+        self.mongo_writer.next_retry = 0.0
+        self.databaseStatusLabel.setText('Database: connected')
+
+    def on_database_failed(self, message):
+        print(f'MongoDB connection failed: {message}')
+        self.databaseStatusLabel.setText('Database: offline, readings are spooled')
+        QMessageBox.warning(self, 'Database Connection Error', 'Failed to connect to the MongoDB server!')
 
     def on_page_changed(self, index):
         current_page = self.stackedWidget.currentWidget()
@@ -70,43 +588,151 @@ class MainUI(QMainWindow):
             self.showFullScreen() 
 
     def check_serial_port(self):
-        
-        ports = serial.tools.list_ports.comports()
-
-        usbPorts = []
-
-        for port in ports:
-            if 'USB' in port.description:
-                usbPorts.append(port.device)
+        # configured ports (device paths or pyserial URLs such as socket://host:port) skip USB discovery
+        configuredPorts = SETTINGS["serial"]["ports"]
+        if configuredPorts:
+            QTimer.singleShot(0, lambda: self.on_ports_found([(port, port) for port in configuredPorts]))
+            return
+
+        self.port_task = BackgroundTask(find_usb_ports, self)
+        self.port_task.done.connect(self.on_ports_found)
+        self.port_task.failed.connect(lambda message: self.on_ports_found([]))
+        self.port_task.start()
+
+    def on_ports_found(self, usbPorts):
+        for port_name, device_id in usbPorts:
+            print(f"Serial port found: {port_name} ({device_id})")
+            analyser = Analyser(device_id, port_name)
+            if self.establish_serial_connection(analyser):
+                self.analysers.append(analyser)
+
+        if not self.analysers:
+            self.serialStatusLabel.setText('Analysers: not found')
+            QMessageBox.critical(self, "Port Not Availabe", "No USB serial port found. The application cannot proceed!")
+            self.close()
+            return
 
-        if usbPorts:
-            self.port_name = usbPorts[0]
-            print(f"USB Serial Port found: {self.port_name}")
-            self.establish_serial_connection()
+        self.update_serial_status()
+        if self.mainTabs:
+            self.ensure_main_page()
+        self.stackedWidget.setCurrentWidget(self.loginPage)
 
-        else:
-            QMessageBox.critical(self, "Port Not Availabe", "No USB serial port found. The application cannot proceed!")
-            sys.exit()
+        # from here on adapters can come and go; the engines reconnect on their own
+        if SETTINGS["serial"]["ports"]:
+            return
+        self.port_watcher = PortWatcher(usbPorts, SETTINGS["serial"]["portPollIntervalMs"] / 1000)
+        self.port_watcher.port_added.connect(self.on_port_added)
+        self.port_watcher.port_removed.connect(self.on_port_removed)
+        self.port_watcher.start()
+
+    def find_analyser(self, device_id):
+        return next((analyser for analyser in self.analysers if analyser.device_id == device_id), None)
+
+    def on_port_added(self, port_name, device_id):
+        analyser = self.find_analyser(device_id)
+        if analyser:
+            # the adapter may come back under another device name
+            print(f"{device_id} plugged back in on {port_name}")
+            analyser.port_name = port_name
+            analyser.serial_engine.request_reconnect(port_name)
+            return
+
+        print(f"New analyser {device_id} on {port_name}")
+        analyser = Analyser(device_id, port_name)
+        if self.establish_serial_connection(analyser):
+            self.analysers.append(analyser)
+            if self.mainTabs:
+                self.ensure_main_page()
+            self.update_serial_status()
+
+    def on_port_removed(self, port_name, device_id):
+        print(f"{device_id} unplugged from {port_name}")
+        analyser = self.find_analyser(device_id)
+        if analyser:
+            analyser.connected = False
+            self.update_serial_status()
+
+    def on_connection_lost(self, analyser, message):
+        print(f"Serial connection lost on {analyser.port_name}: {message}")
+        analyser.connected = False
+        self.update_serial_status()
+
+    def on_connection_restored(self, analyser, port_name):
+        analyser.connected = True
+        self.update_serial_status()
+
+    def update_serial_status(self):
+        states = [analyser.device_id if analyser.connected else f"{analyser.device_id} reconnecting..."
+                  for analyser in self.analysers]
+        self.serialStatusLabel.setText('Analysers: ' + ', '.join(states))
             
-    def establish_serial_connection(self):
+    def establish_serial_connection(self, analyser):
         try:
-            self.serial_connection = serial.Serial(self.port_name, 9600)
-            print(f"Serial connection established on {self.port_name}")
-            
-            self.mainPage.serial_connection = self.serial_connection
-            
-            self.stackedWidget.setCurrentWidget(self.loginPage)
-            
+            serialSettings = SETTINGS["serial"]
+            analyser.serial_connection = serial.serial_for_url(analyser.port_name, serialSettings["baudRate"], timeout=0.05)
+            print(f"Serial connection established on {analyser.port_name} at {serialSettings['baudRate']} baud")
+
         except serial.SerialException as e:
-            QMessageBox.critical(self, "Serial Connection Error", f"Failed to establish serial connection: {str(e)}")
-            sys.exit()
+            QMessageBox.warning(self, "Serial Connection Error", f"Failed to establish serial connection on {analyser.port_name}: {str(e)}")
+            return False
+
+        # every rig gets its own engine thread; they only share the MongoWriter
+        analyser.serial_engine = SerialEngine(analyser.serial_connection,
+                                              max_in_flight=serialSettings["maxInFlight"],
+                                              command_timeout=serialSettings["commandTimeoutMs"] / 1000,
+                                              frame_format=serialSettings["frameFormat"],
+                                              binary_request=serialSettings["binaryRequest"],
+                                              binary_ack=serialSettings["binaryAck"],
+                                              reconnect_initial=serialSettings["reconnectInitialMs"] / 1000,
+                                              reconnect_max=serialSettings["reconnectMaxMs"] / 1000)
+        analyser.serial_engine.error.connect(lambda message, analyser=analyser: self.handle_serial_error(analyser, message))
+        analyser.serial_engine.connection_lost.connect(lambda message, analyser=analyser: self.on_connection_lost(analyser, message))
+        analyser.serial_engine.connection_restored.connect(lambda port_name, analyser=analyser: self.on_connection_restored(analyser, port_name))
+        analyser.serial_engine.start()
+        return True
             
+    def handle_serial_error(self, analyser, message):
+        print(f"Serial connection lost on {analyser.port_name}: {message}")
+        self.serialStatusLabel.setText(f'Analysers: {analyser.device_id} lost')
+        QMessageBox.critical(self, "Serial Connection Error", f"Serial connection lost on {analyser.device_id}: {message}")
+
     def closeEvent(self, event):
-        if self.serial_connection and self.serial_connection.is_open:
-            print('Closing serial connection...')
-            self.serial_connection.close()
-            print('Serial connection terminated!')
+        for task in (self.database_task, self.port_task):
+            if task:
+                task.wait()
+
+        if self.port_watcher:
+            self.port_watcher.stop()
+
+        if self.archive_compactor:
+            self.archive_compactor.stop()
+
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+
+        for analyser in self.analysers:
+            if analyser.page and analyser.page.worker_thread:
+                analyser.page.worker_thread.stop()
+                analyser.page.worker_thread.wait()
+
+            if analyser.serial_engine:
+                analyser.serial_engine.stop()
+
+            if analyser.serial_connection and analyser.serial_connection.is_open:
+                print(f'Closing serial connection on {analyser.port_name}...')
+                analyser.serial_connection.close()
+                print('Serial connection terminated!')
             
+        if self.mongo_writer:
+            print('Flushing pending readings to MongoDB...')
+            self.mongo_writer.flush()
+            print(f'MongoDB writer stopped: {self.mongo_writer.stats()}')
+
+        self.fluid_registry.close()
+
+        if self.column_writer:
+            self.column_writer.flush()
+
         if self.client:
             print('Closing MongoDB connection...')
             self.client.close()
@@ -118,12 +744,9 @@ class LoginUI(QMainWindow):
     def __init__(self, mainUI, serial_connection):
         super(LoginUI, self).__init__()
         
-        loadUi('Assets/UiFiles/newLogin.ui',self)
+        load_ui('Assets/UiFiles/newLogin.ui', self)
         
-        self.setStyleSheet("QMainWindow {"
-                           "background-image: url('Assets/Images/loginCover.jpg');"  
-                           "background-position: center;"
-                           "}")
+        # painted by hand instead of a background-image stylesheet, which decodes the whole cover on every polish
 
         self.loginButton.clicked.connect(self.check_credentials)
         self.mainUI = mainUI
@@ -134,12 +757,12 @@ class LoginUI(QMainWindow):
 
         self.load_logo()
 
-    def load_logo(self):
-        pixmap = QPixmap('Assets/Images/xymaLogoWhite.png') 
+    def paintEvent(self, event):
+        paint_cover(self, 'loginCover.jpg')
+        super(LoginUI, self).paintEvent(event)
 
-        resized_pixmap = pixmap.scaled(200, 100, aspectRatioMode=1) 
-    
-        self.loginPageXymaLogoLabel.setPixmap(resized_pixmap)
+    def load_logo(self):
+        self.loginPageXymaLogoLabel.setPixmap(cached_pixmap('xymaLogoWhite.png', 200, 100))
         self.loginPageXymaLogoLabel.setScaledContents(True)
 
     def check_credentials(self):
@@ -152,43 +775,502 @@ class LoginUI(QMainWindow):
        
 
 
-            self.mainUI.stackedWidget.setCurrentWidget(self.mainUI.mainPage) 
+            self.mainUI.stackedWidget.setCurrentWidget(self.mainUI.ensure_main_page()) 
         else:
             QMessageBox.warning(self, "Login Failed", "Invalid email or password. Please try again.")
                
-# serial reading thread in testing page    
-class SerialReaderThread(QThread):
-    # data_received = pyqtSignal(str)
-    
-    def __init__(self, serial_connection):
-        super(SerialReaderThread, self).__init__()
+PRIORITY_STOP = 0  # "2"
+PRIORITY_CONTROL = 1  # "0" fill, "1" drain, "7"/"8" cooling
+PRIORITY_STATUS = 2  # "3" status poll
+
+class SerialCommand:
+    def __init__(self, request_id, data, priority, timeout, expects_reply):
+        self.request_id = request_id
+        self.data = data
+        self.priority = priority
+        self.timeout = timeout
+        self.expects_reply = expects_reply
+        self.sent_at = None
+
+    def __lt__(self, other):
+        return (self.priority, self.request_id) < (other.priority, other.request_id)
+
+    def matches(self, reply):
+        # a status request is only answered by a status frame, other commands take the next text line
+        if self.data == "3":
+            return is_status_reply(reply)
+        return not is_status_reply(reply)
+
+# binary status frame: sync 0xAA 0x55, oil status, tandelta, temperature, aux, wear debris, checksum
+BINARY_SYNC = b"\xaa\x55"
+BINARY_FRAME = struct.Struct("<2sB4fH")
+
+# status replies are either raw CSV lines "status,tandelta,temperature,aux,wear debris[,...]"
+# or decoded binary tuples in the same order; CSV lines are parsed later, a block at a time
+FRAME_FIELDS = 5
+FRAME_DTYPE = np.dtype([
+    ("timestamp", "f8"),
+    ("status", "i1"),
+    ("tandelta", "f8"),
+    ("temperature", "f8"),
+    ("aux", "f8"),
+    ("wearDebris", "f8")
+])
+
+def is_status_reply(reply):
+    return isinstance(reply, tuple) or reply[:2] in ("0,", "1,")
+
+def reply_status(reply):
+    return reply[0] if isinstance(reply, tuple) else int(reply[0])
+
+def parse_csv_frame(serialData):
+    frame = []
+    for value in serialData.split(',')[:FRAME_FIELDS]:
+        try:
+            frame.append(float(value))
+        except ValueError:
+            frame.append(float("nan"))
+    frame.extend([float("nan")] * (FRAME_FIELDS - len(frame)))
+    return frame
+
+def parse_csv_block(lines):
+    try:
+        return np.loadtxt(lines, delimiter=',', usecols=range(FRAME_FIELDS), ndmin=2)
+    except ValueError:
+        # a corrupted or short line somewhere in the block: parse line by line with NaN for bad fields
+        return np.array([parse_csv_frame(line) for line in lines], dtype=np.float64)
+
+# replies is a list of (arrival time, status reply); returns one FRAME_DTYPE row per reply
+def parse_status_block(replies):
+    frames = np.empty(len(replies), dtype=FRAME_DTYPE)
+    frames["timestamp"] = [arrival for arrival, _ in replies]
+
+    values = np.empty((len(replies), FRAME_FIELDS), dtype=np.float64)
+    text_rows = [row for row, (_, reply) in enumerate(replies) if isinstance(reply, str)]
+    binary_rows = [row for row, (_, reply) in enumerate(replies) if not isinstance(reply, str)]
+    if text_rows:
+        values[text_rows] = parse_csv_block([replies[row][1] for row in text_rows])
+    if binary_rows:
+        values[binary_rows] = [replies[row][1][:FRAME_FIELDS] for row in binary_rows]
+
+    frames["status"] = values[:, 0]
+    frames["tandelta"] = values[:, 1]
+    frames["temperature"] = values[:, 2]
+    frames["aux"] = values[:, 3]
+    frames["wearDebris"] = values[:, 4]
+    return frames
+
+# owns the serial port: blocking reads with a short timeout, lines split out of a bounded buffer.
+# It is also the only writer; commands are queued by priority and replies matched back to their request id.
+class SerialEngine(QThread):
+    response_received = pyqtSignal(int, object)  # request id, status frame tuple or reply line
+    command_failed = pyqtSignal(int, str)  # request id, reason
+    error = pyqtSignal(str)
+    connection_lost = pyqtSignal(str)  # reason; the engine keeps trying to reopen the port
+    connection_restored = pyqtSignal(str)  # port name
+
+    def __init__(self, serial_connection, read_timeout=0.05, max_buffer=4096, max_in_flight=1, command_timeout=1.0,
+                 frame_format="csv", binary_request="B", binary_ack="BIN", reconnect_initial=0.5, reconnect_max=10.0):
+        super(SerialEngine, self).__init__()
         self.serial_connection = serial_connection
+        self.port_name = serial_connection.port
+        self.reconnect_initial = reconnect_initial
+        self.reconnect_max = reconnect_max  # 0 disables reconnecting: the engine stops and emits error
+        self.reconnect_event = threading.Event()
+        self.serial_connection.timeout = read_timeout
+        self.max_buffer = max_buffer
+        self.requested_format = frame_format
+        self.frame_format = "csv"
+        self.binary_request = binary_request
+        self.binary_ack = binary_ack
+        self.max_in_flight = max_in_flight
+        self.command_timeout = command_timeout
+        self.buffer = bytearray()
+
+        self.queue_lock = threading.Lock()
+        self.pending = []  # heap of SerialCommand
+        self.in_flight = []  # sent commands waiting for a reply, oldest first
+        self.request_ids = itertools.count(1)
         self.running = True
-    
+
+        port = self.port_name
+        self.replies_metric = METRICS.counter("iocl_serial_replies_total", "Replies matched to a command", port=port)
+        self.garbled_metric = METRICS.counter("iocl_serial_garbled_total", "Lines that matched no command and binary frames that failed the checksum", port=port)
+        self.sent_metric = METRICS.counter("iocl_serial_commands_sent_total", "Commands written to the analyser", port=port)
+        self.reconnects_metric = METRICS.counter("iocl_serial_reconnects_total", "Connections restored after a disconnect", port=port)
+        self.reply_latency = METRICS.histogram("iocl_serial_reply_seconds", "Time from writing a command to its reply", port=port)
+        METRICS.gauge("iocl_serial_pending_commands", "Commands queued for the analyser", lambda: len(self.pending), port=port)
+        METRICS.gauge("iocl_serial_in_flight_commands", "Commands sent and waiting for a reply", lambda: len(self.in_flight), port=port)
+
+    def count_failure(self, reason, amount=1):
+        METRICS.counter("iocl_serial_command_failures_total", "Commands that timed out, were cancelled or lost to a disconnect",
+                        port=self.port_name, reason=reason).inc(amount)
+
     def run(self):
+        if self.requested_format in ("auto", "binary"):
+            try:
+                self.negotiate_frame_format()
+            except (serial.SerialException, OSError) as e:
+                # the read below hits the same error and goes through reconnect()
+                print(f"Frame format negotiation failed: {str(e)}")
+
         while self.running:
-            if self.serial_connection and self.serial_connection.in_waiting > 0:
-                serialData = self.serial_connection.readline().decode('utf-8').strip()
-                if serialData:
-                    print(serialData)
+            self.send_pending()
+
+            try:
+                # blocks until at least one byte arrives, the read timeout expires or submit() cancels it
+                chunk = self.serial_connection.read(max(1, self.serial_connection.in_waiting))
+            except (serial.SerialException, OSError) as e:
+                # an unplugged device raises a plain OSError (EIO) from in_waiting rather than a SerialException
+                if not self.running:
+                    break
+                if self.reconnect_max <= 0:
+                    self.error.emit(str(e))
+                    break
+                self.connection_lost.emit(str(e))
+                if not self.reconnect():
+                    break
+                continue
+
+            if chunk:
+                self.buffer += chunk
+                if self.frame_format == "binary":
+                    self.split_frames()
                 else:
-                    self.msleep(10)
-                    
+                    self.split_lines()
+
+            self.expire_in_flight()
+
+    # reopens the same Serial object, so pages holding it stay valid; queued commands wait for the new connection
+    def reconnect(self):
+        try:
+            self.serial_connection.close()
+        except (serial.SerialException, OSError):
+            pass
+
+        for command in self.in_flight:
+            self.command_failed.emit(command.request_id, "disconnected")
+        self.count_failure("disconnected", len(self.in_flight))
+        self.in_flight = []
+        self.buffer.clear()
+
+        delay = self.reconnect_initial
+        while self.running:
+            # request_reconnect() cuts the wait short when the device shows up again
+            self.reconnect_event.wait(delay)
+            self.reconnect_event.clear()
+            if not self.running:
+                break
+            try:
+                self.serial_connection.port = self.port_name
+                self.serial_connection.open()
+                # whatever arrived half-way through a frame before the drop is discarded
+                self.serial_connection.reset_input_buffer()
+                if self.requested_format in ("auto", "binary"):
+                    self.frame_format = "csv"
+                    self.negotiate_frame_format()
+            except (serial.SerialException, OSError) as e:
+                # a device that drops again straight after open() is retried like one that never opened
+                log_event(logging.WARNING, "serial.reconnect_failed", port=self.port_name, retry_s=round(delay, 1), error=str(e))
+                try:
+                    self.serial_connection.close()
+                except (serial.SerialException, OSError):
+                    pass
+                delay = min(delay * 2, self.reconnect_max)
+                continue
+
+            print(f"Serial connection restored on {self.port_name}")
+            self.reconnects_metric.inc()
+            self.connection_restored.emit(self.port_name)
+            return True
+        return False
+
+    def request_reconnect(self, port_name=None):
+        if port_name:
+            self.port_name = port_name
+        self.reconnect_event.set()
+
+    def negotiate_frame_format(self):
+        # devices that do not acknowledge the binary request keep talking CSV; errors reach the caller so reconnect() can retry
+        self.serial_connection.reset_input_buffer()
+        self.serial_connection.write(self.binary_request.encode())
+        deadline = time.monotonic() + self.command_timeout
+        while time.monotonic() < deadline:
+            serialData = self.serial_connection.readline().decode('utf-8', errors='replace').strip()
+            if serialData == self.binary_ack:
+                self.frame_format = "binary"
+                break
+
+        print(f"Serial frame format: {self.frame_format}")
+
+    def split_frames(self):
+        # binary status frames are decoded in place; text replies to other commands are still newline terminated
+        view = memoryview(self.buffer)
+        size = len(self.buffer)
+        pos = 0
+        while pos < size:
+            if self.buffer.startswith(BINARY_SYNC, pos):
+                if size - pos < BINARY_FRAME.size:
+                    break
+                _, status, tandelta, temperature, aux, wear_debris, checksum = BINARY_FRAME.unpack_from(view, pos)
+                if checksum == sum(view[pos + 2:pos + BINARY_FRAME.size - 2]) & 0xFFFF:
+                    self.route_reply((status, tandelta, temperature, aux, wear_debris))
+                    pos += BINARY_FRAME.size
+                else:
+                    self.garbled_metric.inc()
+                    pos += 1  # resynchronise on the next sync marker
+                continue
+
+            end = self.buffer.find(b"\n", pos)
+            sync = self.buffer.find(BINARY_SYNC, pos)
+            if sync != -1 and (end == -1 or sync < end):
+                pos = sync  # bytes in front of a frame are line noise
+                continue
+            if end == -1:
+                break
+
+            serialData = bytes(view[pos:end]).decode('utf-8', errors='replace').strip()
+            if serialData:
+                self.route_reply(serialData)
+            pos = end + 1
+
+        view.release()
+        del self.buffer[:pos]
+
+        if len(self.buffer) > self.max_buffer:
+            del self.buffer[:len(self.buffer) - self.max_buffer]
+
+    def split_lines(self):
+        start = 0
+        end = self.buffer.find(b"\n")
+        while end != -1:
+            serialData = self.buffer[start:end].decode('utf-8', errors='replace').strip()
+            if serialData:
+                self.route_reply(serialData)
+            start = end + 1
+            end = self.buffer.find(b"\n", start)
+        del self.buffer[:start]
+
+        # a device that never sends a newline must not grow the buffer forever
+        if len(self.buffer) > self.max_buffer:
+            del self.buffer[:len(self.buffer) - self.max_buffer]
+
+    def route_reply(self, reply):
+        for command in self.in_flight:
+            if command.matches(reply):
+                self.in_flight.remove(command)
+                self.replies_metric.inc()
+                self.reply_latency.observe(time.monotonic() - command.sent_at)
+                self.response_received.emit(command.request_id, reply)
+                return
+
+        self.garbled_metric.inc()
+        log_event(logging.WARNING, "serial.garbage", port=self.port_name, reply=reply)
+
+    def submit(self, data, priority=PRIORITY_STATUS, timeout=None, expects_reply=True, cancel_lower=False):
+        with self.queue_lock:
+            command = SerialCommand(next(self.request_ids), data, priority,
+                                    self.command_timeout if timeout is None else timeout, expects_reply)
+            if cancel_lower:
+                cancelled = [queued for queued in self.pending if queued.priority > priority]
+                self.pending = [queued for queued in self.pending if queued.priority <= priority]
+                heapq.heapify(self.pending)
+            else:
+                cancelled = []
+            heapq.heappush(self.pending, command)
+
+        for queued in cancelled:
+            self.command_failed.emit(queued.request_id, "cancelled")
+        if cancelled:
+            self.count_failure("cancelled", len(cancelled))
+
+        # wake the reader so the command goes out without waiting for the read timeout
+        if hasattr(self.serial_connection, 'cancel_read'):
+            self.serial_connection.cancel_read()
+        return command.request_id
+
+    def write(self, data):
+        return self.submit(data, priority=PRIORITY_CONTROL, expects_reply=False)
+
+    def send_pending(self):
+        while True:
+            with self.queue_lock:
+                if not self.pending:
+                    return
+                command = self.pending[0]
+                # stop and control commands preempt: they go out even when the in-flight window is full
+                if command.priority == PRIORITY_STATUS and len(self.in_flight) >= self.max_in_flight:
+                    return
+                heapq.heappop(self.pending)
+
+            try:
+                self.serial_connection.write(command.data.encode())
+            except serial.SerialException as e:
+                self.count_failure("write_error")
+                self.command_failed.emit(command.request_id, str(e))
+                continue
+
+            self.sent_metric.inc()
+            if command.expects_reply:
+                command.sent_at = time.monotonic()
+                self.in_flight.append(command)
+
+    def expire_in_flight(self):
+        now = time.monotonic()
+        for command in [command for command in self.in_flight if now - command.sent_at > command.timeout]:
+            self.in_flight.remove(command)
+            self.count_failure("timeout")
+            self.command_failed.emit(command.request_id, "timeout")
+
     def stop(self):
         self.running = False
-        self.quit()
+        self.reconnect_event.set()
+        if hasattr(self.serial_connection, 'cancel_read'):
+            self.serial_connection.cancel_read()
         self.wait()
 
-fluid_name = None 
-selectedTemperature = None 
+# rescans the USB serial ports and reports adapters that were plugged in or pulled out.
+# pyudev, when installed, wakes the scan on tty events; otherwise the ports are polled.
+class PortWatcher(QThread):
+    port_added = pyqtSignal(str, str)  # port name, device id
+    port_removed = pyqtSignal(str, str)
+
+    def __init__(self, known_ports=(), poll_interval=1.0):
+        super(PortWatcher, self).__init__()
+        self.known_ports = set(known_ports)
+        self.poll_interval = poll_interval
+        self.running = True
+        self.wake_event = threading.Event()
+
+    def run(self):
+        monitor = None
+        try:
+            import pyudev
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by('tty')
+            monitor.start()
+        except (ImportError, OSError):
+            pass
+
+        while self.running:
+            if monitor is not None:
+                monitor.poll(timeout=self.poll_interval)
+            else:
+                self.wake_event.wait(self.poll_interval)
+            if not self.running:
+                break
+
+            ports = set(find_usb_ports())
+            for port_name, device_id in ports - self.known_ports:
+                self.port_added.emit(port_name, device_id)
+            for port_name, device_id in self.known_ports - ports:
+                self.port_removed.emit(port_name, device_id)
+            self.known_ports = ports
+
+    def stop(self):
+        self.running = False
+        self.wake_event.set()
+        self.wait()
+
+# fluid entries ("name-temperature") live in SQLite; the names are loaded once and kept in memory
+# so dialogs look them up without touching the disk. fluidData.json is imported on first use.
+class FluidRegistry:
+    def __init__(self, path="fluidData.db", legacy_path="fluidData.json"):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")  # fsync every committed entry
+        self.connection.execute("CREATE TABLE IF NOT EXISTS fluids ("
+                                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                "name TEXT NOT NULL UNIQUE, "
+                                "created TEXT NOT NULL)")
+        # the fluid each analyser's cell was last filled with, so a restart resumes the right entry on every rig
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cells ("
+                                "device TEXT PRIMARY KEY, "
+                                "name TEXT NOT NULL, "
+                                "updated TEXT NOT NULL)")
+        self.connection.commit()
+
+        self.fluids = []
+        self.index = set()
+        self.last_id = 0
+        self.refresh()
+
+        if not self.fluids:
+            self.import_legacy(legacy_path)
+
+    def import_legacy(self, legacy_path):
+        try:
+            with open(legacy_path, "r") as file:
+                data = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO fluids (name, created) VALUES (?, ?)",
+                                        [(entry, datetime.now().isoformat()) for entry in data])
+        self.refresh()
+        print(f"Imported {len(self.fluids)} fluid entries from {legacy_path}")
+
+    def refresh(self):
+        # picks up entries added by another instance since the last read
+        with self.lock:
+            rows = self.connection.execute("SELECT id, name FROM fluids WHERE id > ? ORDER BY id", (self.last_id,)).fetchall()
+            for row_id, name in rows:
+                self.fluids.append(name)
+                self.index.add(name)
+                self.last_id = row_id
+
+    def add(self, entry):
+        self.refresh()
+        with self.lock:
+            if entry in self.index:
+                return False
+            with self.connection:
+                cursor = self.connection.execute("INSERT OR IGNORE INTO fluids (name, created) VALUES (?, ?)",
+                                                 (entry, datetime.now().isoformat()))
+            if cursor.rowcount == 0:
+                return False
+            self.fluids.append(entry)
+            self.index.add(entry)
+            self.last_id = cursor.lastrowid
+            return True
+
+    def __contains__(self, entry):
+        return entry in self.index
+
+    def names(self):
+        return list(self.fluids)
+
+    def is_empty(self):
+        return not self.fluids
+
+    def set_cell(self, device_id, entry):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO cells (device, name, updated) VALUES (?, ?, ?)",
+                                    (str(device_id), entry, datetime.now().isoformat()))
+
+    def cell(self, device_id):
+        with self.lock:
+            row = self.connection.execute("SELECT name FROM cells WHERE device = ?", (str(device_id),)).fetchone()
+        return row[0] if row else None
+
+    def clear_cell(self, device_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM cells WHERE device = ?", (str(device_id),))
+
+    def close(self):
+        self.connection.close()
+
 class StartButtonPopup(QDialog):
-    def __init__(self, parent=None, collection=None):
+    def __init__(self, parent=None, collection=None, fluid_registry=None):
         super(StartButtonPopup, self).__init__(parent)
         
-        loadUi("Assets/UiFiles/startButtonPopup.ui",self)
+        load_ui("Assets/UiFiles/startButtonPopup.ui", self)
         
         self.parent = parent
         self.collection = collection
+        self.fluid_registry = fluid_registry
         
         self.setWindowTitle('Fluid Entry')
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
@@ -208,9 +1290,8 @@ class StartButtonPopup(QDialog):
 
   
     def on_submit(self):
-        global fluid_name 
-        global selectedTemperature
         fluid_name = self.fluidNameTextbox.text()
+        selectedTemperature = None
 
         
         if self.tempOpt1.isChecked():
@@ -241,143 +1322,1871 @@ class StartButtonPopup(QDialog):
             #     QMessageBox.warning(self, 'Database Connection Error', 'Failed to connect to the MongoDB server!')
             #     return
             
-            try:
-                with open("fluidData.json","r") as file:
-                    data = json.load(file)
-            except (FileNotFoundError, json.JSONDecodeError):
-                data = []
-                
-            if entry in data:
+            if not self.fluid_registry.add(entry):
                 QMessageBox.warning(self, 'Duplicate Entry', 'This fluid name and temperature already exists!')
             else:
-                data.append(entry)
-
-                with open ('fluidData.json', "w") as file:
-                    json.dump(data, file, indent=4)
-
                 print(f"Fluid Name: {fluid_name}, Temperature: {selectedTemperature}")
+                # the session belongs to the analyser page the popup was opened from
+                self.parent.session = TestSession(fluid_name, selectedTemperature, device_id=self.parent.device_id)
+                self.fluid_registry.set_cell(self.parent.device_id, entry)
                 self.accept()
    
+REPORT_FORMATS = {
+    "Excel": "xlsx",
+    "CSV": "csv",
+    "Parquet": "parquet"
+}
+
+# interval in seconds for resampled reports, None for every raw reading
+REPORT_INTERVALS = {
+    "All readings": None,
+    "1 second": 1,
+    "1 minute": 60,
+    "1 hour": 3600,
+    "Summary": "summary"
+}
+
+# every report has a fixed set of columns, so a key missing from the first rows is not lost for the whole file
+READING_COLUMNS = ("FluidName",) + MEASUREMENT_FIELDS + ("Timestamp", "DeviceId", "TestTemperature", "RunId")
+RESAMPLED_COLUMNS = ("FluidName", "Timestamp") + MEASUREMENT_FIELDS + ("Readings",)
+SUMMARY_COLUMNS = ("FluidName", "Readings", "From", "To") + tuple(
+    f"{field}{stat}" for field in MEASUREMENT_FIELDS for stat in ("Min", "Max", "Mean", "Std"))
+
+def report_columns(interval, sources=()):
+    if interval == "summary":
+        return SUMMARY_COLUMNS
+    if interval is not None:
+        return RESAMPLED_COLUMNS
+    # archived minutes stand in for raw readings that have expired and carry their reading count
+    if any(pipeline is not None for _, _, pipeline in sources):
+        return READING_COLUMNS + ("Readings",)
+    return READING_COLUMNS
+
+def report_query(fluid, start=None, end=None):
+    query = {"FluidName": fluid}
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = start
+    if end is not None:
+        bounds["$lt"] = end
+    if bounds:
+        query["Timestamp"] = bounds
+    return query
+
+# averages every metric per time bucket inside MongoDB; buckets are aligned to epoch multiples of the interval
+def resample_pipeline(query, seconds):
+    bucket_ms = seconds * 1000
+    epoch = datetime(1970, 1, 1)
+    elapsed_ms = {"$subtract": ["$Timestamp", epoch]}
+    group = {"_id": {"$subtract": [elapsed_ms, {"$mod": [elapsed_ms, bucket_ms]}]}}
+    project = {"_id": 0, "FluidName": {"$literal": query["FluidName"]}, "Timestamp": {"$add": [epoch, "$_id"]}}
+    for field in MEASUREMENT_FIELDS:
+        group[field] = {"$avg": f"${field}"}
+        project[field] = 1
+    group["Readings"] = {"$sum": 1}
+    project["Readings"] = 1
+
+    return [
+        {"$match": query},
+        {"$group": group},
+        {"$sort": {"_id": 1}},
+        {"$project": project}
+    ]
+
+# one row of min/max/mean/std per metric for the selected fluid and range
+def summary_pipeline(query):
+    group = {
+        "_id": "$FluidName",
+        "Readings": {"$sum": 1},
+        "From": {"$min": "$Timestamp"},
+        "To": {"$max": "$Timestamp"}
+    }
+    for field in MEASUREMENT_FIELDS:
+        group[f"{field}Min"] = {"$min": f"${field}"}
+        group[f"{field}Max"] = {"$max": f"${field}"}
+        group[f"{field}Mean"] = {"$avg": f"${field}"}
+        group[f"{field}Std"] = {"$stdDevSamp": f"${field}"}
+        group[f"{field}Count"] = {"$sum": {"$cond": [{"$gt": [f"${field}", None]}, 1, 0]}}
+
+    project = {"_id": 0, "FluidName": "$_id"}
+    project.update({key: 1 for key in group if key != "_id"})
+
+    return [
+        {"$match": query},
+        {"$group": group},
+        {"$project": project}
+    ]
+
+ARCHIVE_TIERS = {"minute": 60, "hour": 3600}
+
+def floor_time(moment, seconds):
+    return moment - (moment - datetime(1970, 1, 1)) % timedelta(seconds=seconds)
+
+# raw readings of [start, end) rolled up into per-minute min/max/mean/count inside MongoDB; Bucket is the
+# minute's start in epoch milliseconds
+def minute_rollup_pipeline(start, end):
+    epoch = datetime(1970, 1, 1)
+    elapsed_ms = {"$subtract": ["$Timestamp", epoch]}
+    group = {"_id": {"FluidName": "$FluidName",
+                     "Bucket": {"$subtract": [elapsed_ms, {"$mod": [elapsed_ms, 60000]}]}},
+             "Readings": {"$sum": 1}}
+    for field in MEASUREMENT_FIELDS:
+        group[f"{field}Min"] = {"$min": f"${field}"}
+        group[f"{field}Max"] = {"$max": f"${field}"}
+        group[f"{field}Mean"] = {"$avg": f"${field}"}
+
+    project = {"_id": 0, "FluidName": "$_id.FluidName", "Bucket": "$_id.Bucket"}
+    project.update({key: 1 for key in group if key != "_id"})
+    return [
+        {"$match": {"Timestamp": {"$gte": start, "$lt": end}}},
+        {"$group": group},
+        {"$project": project}
+    ]
+
+# coarser buckets from finer ones: means are weighted by the readings behind them
+def rollup_buckets(buckets, seconds):
+    groups = {}
+    for bucket in buckets:
+        groups.setdefault((bucket["FluidName"], floor_time(bucket["Timestamp"], seconds)), []).append(bucket)
+
+    rolled = []
+    for (fluid, timestamp), items in groups.items():
+        document = {"FluidName": fluid, "Timestamp": timestamp, "Readings": sum(item["Readings"] for item in items)}
+        for field in MEASUREMENT_FIELDS:
+            minimums = [item[f"{field}Min"] for item in items if item.get(f"{field}Min") is not None]
+            maximums = [item[f"{field}Max"] for item in items if item.get(f"{field}Max") is not None]
+            weighted = [(item[f"{field}Mean"], item["Readings"]) for item in items if item.get(f"{field}Mean") is not None]
+            count = sum(readings for _, readings in weighted)
+            document[f"{field}Min"] = min(minimums) if minimums else None
+            document[f"{field}Max"] = max(maximums) if maximums else None
+            document[f"{field}Mean"] = sum(mean * readings for mean, readings in weighted) / count if count else None
+        rolled.append(document)
+    return rolled
+
+# tier rows in the same shape as resample_pipeline rows, so archived and raw parts of a report line up
+def tier_pipeline(query):
+    project = {"_id": 0, "FluidName": 1, "Timestamp": 1}
+    project.update({field: f"${field}Mean" for field in MEASUREMENT_FIELDS})
+    project["Readings"] = 1
+    return [
+        {"$match": query},
+        {"$sort": {"Timestamp": 1}},
+        {"$project": project}
+    ]
+
+# summary_pipeline over a tier; the standard deviation needs the raw readings, so it is left empty
+def tier_summary_pipeline(query):
+    group = {
+        "_id": "$FluidName",
+        "Readings": {"$sum": "$Readings"},
+        "From": {"$min": "$Timestamp"},
+        "To": {"$max": "$Timestamp"}
+    }
+    project = {"_id": 0, "FluidName": "$_id", "Readings": 1, "From": 1, "To": 1}
+    for field in MEASUREMENT_FIELDS:
+        mean = f"${field}Mean"
+        group[f"{field}Min"] = {"$min": f"${field}Min"}
+        group[f"{field}Max"] = {"$max": f"${field}Max"}
+        group[f"{field}Weighted"] = {"$sum": {"$multiply": [mean, "$Readings"]}}
+        group[f"{field}Count"] = {"$sum": {"$cond": [{"$gt": [mean, None]}, "$Readings", 0]}}
+        project[f"{field}Min"] = 1
+        project[f"{field}Max"] = 1
+        project[f"{field}Mean"] = {"$cond": [{"$gt": [f"${field}Count", 0]},
+                                             {"$divide": [f"${field}Weighted", f"${field}Count"]}, None]}
+        project[f"{field}Std"] = {"$literal": None}
+        project[f"{field}Count"] = 1
+
+    return [
+        {"$match": query},
+        {"$group": group},
+        {"$project": project}
+    ]
+
+# folds the summary rows of every report source into one row. Means are weighted by each part's reading count;
+# the standard deviation is pooled exactly while every part has one and left empty once a tier part is needed.
+def merge_summaries(rows):
+    merged = None
+    for row in rows:
+        if merged is None:
+            merged = dict(row)
+            continue
+        merged["Readings"] += row["Readings"]
+        merged["From"] = min(merged["From"], row["From"])
+        merged["To"] = max(merged["To"], row["To"])
+        for field in MEASUREMENT_FIELDS:
+            count, other = merged[f"{field}Count"], row[f"{field}Count"]
+            if not other:
+                continue
+            if not count:
+                merged.update({f"{field}{key}": row[f"{field}{key}"] for key in ("Min", "Max", "Mean", "Std", "Count")})
+                continue
+            mean, otherMean = merged[f"{field}Mean"], row[f"{field}Mean"]
+            total = count + other
+            combined = (mean * count + otherMean * other) / total
+            std, otherStd = merged[f"{field}Std"], row[f"{field}Std"]
+            # $stdDevSamp gives None for a single reading, which contributes no spread of its own
+            if (std is None and count > 1) or (otherStd is None and other > 1):
+                merged[f"{field}Std"] = None
+            else:
+                squares = ((count - 1) * (std or 0) ** 2 + count * (mean - combined) ** 2 +
+                           (other - 1) * (otherStd or 0) ** 2 + other * (otherMean - combined) ** 2)
+                merged[f"{field}Std"] = math.sqrt(squares / (total - 1))
+            merged[f"{field}Min"] = min(merged[f"{field}Min"], row[f"{field}Min"])
+            merged[f"{field}Max"] = max(merged[f"{field}Max"], row[f"{field}Max"])
+            merged[f"{field}Mean"] = combined
+            merged[f"{field}Count"] = total
+
+    if merged is not None:
+        yield {column: merged[column] for column in SUMMARY_COLUMNS}
+
+# long-term storage for fluidCollection: raw readings older than compactAfterDays are rolled up into minute and
+# hour tiers, minute rows expire through a TTL index, hour rows are kept for good.
+# Compaction moves a watermark ("until") forward one hour-aligned chunk at a time, so it can stop and resume
+# anywhere. Raw readings are only deleted by compaction, inside the compacted window [since, until), so nothing
+# expires before it has been rolled up however far behind compaction is.
+class FluidArchive:
+    def __init__(self, db, raw_collection, compact_after_days=7, raw_retention_days=90, minute_retention_days=730,
+                 chunk_hours=24, time_series=False):
+        self.db = db
+        self.raw = raw_collection
+        self.tiers = {tier: db[f"fluidArchive{tier.capitalize()}"] for tier in ARCHIVE_TIERS}
+        self.state = db["fluidArchiveState"]
+        self.compact_after = timedelta(days=compact_after_days)
+        self.raw_retention = timedelta(days=raw_retention_days) if raw_retention_days > 0 else None
+        self.minute_retention = timedelta(days=minute_retention_days) if minute_retention_days > 0 else None
+        self.chunk = timedelta(hours=chunk_hours)
+        self.time_series = time_series
+        self.buckets_written = METRICS.counter("iocl_archive_buckets_total", "Archive rows written by compaction")
+        self.raw_expiring = False
+
+    def prepare(self):
+        for collection in self.tiers.values():
+            collection.create_index([("FluidName", ASCENDING), ("Timestamp", ASCENDING)], name="FluidName_Timestamp")
+        # a TTL on the raw readings would not wait for compaction; earlier versions created one
+        self.set_expiry(self.raw, None, self.time_series)
+        self.set_expiry(self.tiers["minute"], self.minute_retention)
+
+    def set_expiry(self, collection, retention, time_series=False):
+        seconds = int(retention.total_seconds()) if retention else None
+        try:
+            if time_series:
+                # time-series collections expire documents through a collection option, not an index
+                self.db.command("collMod", collection.name, expireAfterSeconds=seconds if seconds else "off")
+            elif seconds is None:
+                if "Timestamp_ttl" in collection.index_information():
+                    collection.drop_index("Timestamp_ttl")
+            else:
+                try:
+                    collection.create_index("Timestamp", name="Timestamp_ttl", expireAfterSeconds=seconds)
+                except OperationFailure:
+                    # the retention setting changed since the index was created
+                    self.db.command("collMod", collection.name,
+                                    index={"name": "Timestamp_ttl", "expireAfterSeconds": seconds})
+        except OperationFailure as e:
+            print(f"Error setting the expiry of {collection.name}: {e}")
+
+    # (since, until) of the compacted window, or None before the first compaction
+    def compacted_window(self):
+        state = self.state.find_one({"_id": "compaction"})
+        if state is None:
+            return None
+        if "since" not in state:
+            first = self.tiers["hour"].find_one({}, {"Timestamp": 1}, sort=[("Timestamp", ASCENDING)])
+            return (first["Timestamp"] if first else state["until"]), state["until"]
+        return state["since"], state["until"]
+
+    def compact(self, now=None, should_stop=lambda: False):
+        now = now or datetime.now()
+        cutoff = floor_time(now - self.compact_after, 3600)
+        # readings saved as strings before migrateFluidCollection.py sort before every date and are left alone
+        first = self.raw.find_one({"Timestamp": {"$type": "date"}}, {"Timestamp": 1}, sort=[("Timestamp", ASCENDING)])
+        window = self.compacted_window()
+        if window is None:
+            if first is None:
+                return 0
+            since = until = floor_time(first["Timestamp"], 3600)
+            self.state.update_one({"_id": "compaction"}, {"$set": {"since": since, "until": until}}, upsert=True)
+        else:
+            since, until = window
+
+        written = 0
+        # readings older than the window, e.g. just converted by migrateFluidCollection.py, are rolled up first;
+        # the tiers hold nothing before since, so these chunks cannot clash with rows already there
+        if first is not None and first["Timestamp"] < since:
+            start = floor_time(first["Timestamp"], 3600)
+            while start < since and not should_stop():
+                end = min(start + self.chunk, since)
+                written += self.compact_chunk(start, end)
+                start = end
+            if start < since:
+                return written
+            since = floor_time(first["Timestamp"], 3600)
+            self.state.update_one({"_id": "compaction"}, {"$set": {"since": since}})
+        self.expire_raw(since, until, now)
+
+        while until < cutoff and not should_stop():
+            end = min(until + self.chunk, cutoff)
+            written += self.compact_chunk(until, end)
+            self.state.update_one({"_id": "compaction"}, {"$set": {"until": end}}, upsert=True)
+            until = end
+            self.expire_raw(since, until, now)
+        if written:
+            log_event(logging.INFO, "archive.compacted", rows=written, since=since.isoformat(), until=until.isoformat())
+        return written
+
+    def compact_chunk(self, start, end):
+        minutes = list(self.raw.aggregate(minute_rollup_pipeline(start, end), allowDiskUse=True))
+        for minute in minutes:
+            minute["Timestamp"] = datetime(1970, 1, 1) + timedelta(milliseconds=minute.pop("Bucket"))
+        hours = rollup_buckets(minutes, ARCHIVE_TIERS["hour"])
+        return self.replace(self.tiers["minute"], start, end, minutes) + self.replace(self.tiers["hour"], start, end, hours)
+
+    # raw readings past rawRetentionDays go once both tiers hold them
+    def expire_raw(self, since, until, now):
+        if self.raw_retention is None:
+            return
+        if self.time_series:
+            # time-series collections only expire through the collection option; it is on while compaction keeps up
+            caught_up = until >= now - self.raw_retention
+            if caught_up != self.raw_expiring:
+                self.set_expiry(self.raw, self.raw_retention if caught_up else None, True)
+                self.raw_expiring = caught_up
+            return
+        before = min(until, now - self.raw_retention)
+        if before <= since:
+            return
+        deleted = self.raw.delete_many({"Timestamp": {"$gte": since, "$lt": before}}).deleted_count
+        if deleted:
+            log_event(logging.INFO, "archive.raw_expired", readings=deleted, before=before.isoformat())
+
+    def replace(self, collection, start, end, buckets):
+        # a chunk is rewritten as a whole, so compacting it again after a crash never duplicates rows;
+        # the watermark only moves once both tiers are written
+        collection.delete_many({"Timestamp": {"$gte": start, "$lt": end}})
+        if buckets:
+            collection.insert_many(buckets, ordered=False)
+            self.buckets_written.inc(len(buckets))
+        return len(buckets)
+
+    # (collection, query, pipeline) parts that make up a report, oldest first. The coarsest tier the interval
+    # allows is used wherever it has data, finer tiers fill in the rest, and data only kept at a coarser
+    # resolution than asked for comes from the finest tier still holding it.
+    def report_sources(self, query, interval, now=None):
+        window = self.compacted_window()
+        if window is None:
+            return [(self.raw, query, raw_report_pipeline(query, interval))]
+
+        now = now or datetime.now()
+        since, until = window
+        # raw readings are kept before the compacted window and from the expiry point on
+        raw_from = min(until, now - self.raw_retention) if self.raw_retention else datetime.min
+        minute_from = max(since, now - self.minute_retention) if self.minute_retention else since
+        tiers = [("raw", 0, raw_from, datetime.max),
+                 ("raw", 0, datetime.min, since),
+                 ("minute", ARCHIVE_TIERS["minute"], minute_from, until),
+                 ("hour", ARCHIVE_TIERS["hour"], since, until)]
+        # a summary reads raw readings wherever they are kept, only they give the standard deviation
+        resolution = 0 if interval == "summary" else interval or 0
+        allowed = sorted((tier for tier in tiers if tier[1] <= resolution), key=lambda tier: -tier[1])
+        preference = allowed + [tier for tier in tiers if tier not in allowed]
+
+        timestamps = query.get("Timestamp", {})
+        uncovered = [(timestamps.get("$gte", datetime.min), timestamps.get("$lt", datetime.max))]
+        parts = []
+        for name, _, available_from, available_until in preference:
+            remaining = []
+            for start, end in uncovered:
+                low, high = max(start, available_from), min(end, available_until)
+                if low >= high:
+                    remaining.append((start, end))
+                    continue
+                parts.append((low, high, name))
+                if start < low:
+                    remaining.append((start, low))
+                if high < end:
+                    remaining.append((high, end))
+            uncovered = remaining
+
+        sources = []
+        for low, high, name in sorted(parts):
+            partQuery = {"FluidName": query["FluidName"]}
+            bounds = {}
+            if low != datetime.min:
+                bounds["$gte"] = low
+            if high != datetime.max:
+                bounds["$lt"] = high
+            if bounds:
+                partQuery["Timestamp"] = bounds
+
+            if name == "raw":
+                sources.append((self.raw, partQuery, raw_report_pipeline(partQuery, interval)))
+            elif interval == "summary":
+                sources.append((self.tiers[name], partQuery, tier_summary_pipeline(partQuery)))
+            else:
+                sources.append((self.tiers[name], partQuery, tier_pipeline(partQuery)))
+        return sources
+
+def raw_report_pipeline(query, interval):
+    if interval is None:
+        return None
+    if interval == "summary":
+        return summary_pipeline(query)
+    return resample_pipeline(query, interval)
+
+# runs FluidArchive.compact in the background every intervalMs
+class ArchiveCompactor(QThread):
+    def __init__(self, archive, interval=3600.0, parent=None):
+        super(ArchiveCompactor, self).__init__(parent)
+        self.archive = archive
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.archive.compact(should_stop=self.stop_event.is_set)
+            except PyMongoError as e:
+                log_event(logging.WARNING, "archive.compact_failed", error=str(e))
+            except Exception:
+                # anything unexpected is logged and retried next interval instead of ending the thread
+                LOGGER.exception("archive.compact_failed")
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+        self.wait()
+
+# report rows kept on disk, keyed by fluid, range and interval, so downloading the same report again only reads
+# the readings stored since the last download. Rows are appended as pickled batches up to a high-water mark
+# ("until"); a copy of the finished file is kept per format. Least recently used entries go once maxMb is passed.
+class ReportCache:
+    def __init__(self, directory="__reportcache__", max_bytes=512 * 2 ** 20, check_window=timedelta(days=7)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.check_window = check_window
+        self.lock = threading.Lock()
+        self.busy = set()
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.index_path, "r") as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+        self.outcomes = {outcome: METRICS.counter("iocl_report_cache_total", "Report downloads by cache outcome",
+                                                  outcome=outcome) for outcome in ("hit", "refresh", "miss")}
+
+    @staticmethod
+    def key(fluid, start, end, interval):
+        return json.dumps([fluid, start.isoformat() if start else None, end.isoformat() if end else None, interval])
+
+    def path(self, entry, suffix):
+        return os.path.join(self.directory, f"{entry['name']}.{suffix}")
+
+    # one export per entry at a time; a second one for the same report simply bypasses the cache
+    def acquire(self, key):
+        with self.lock:
+            if key in self.busy:
+                return False
+            self.busy.add(key)
+            return True
+
+    def release(self, key):
+        with self.lock:
+            self.busy.discard(key)
+
+    def check_count(self, collection, fluid, until):
+        return collection.count_documents({"FluidName": fluid,
+                                           "Timestamp": {"$gte": until - self.check_window, "$lt": until}})
+
+    def lookup(self, key, collection, fluid):
+        entry = self.entries.get(key)
+        if entry is None or entry["until"] is None:
+            return None
+        # readings replayed from a spool can land behind the mark; a changed count means the rows are stale
+        if self.check_count(collection, fluid, datetime.fromisoformat(entry["until"])) != entry["check"]:
+            self.remove(key)
+            return None
+        # drop anything appended by an export that was cancelled before it committed
+        with open(self.path(entry, "rows"), "r+b") as file:
+            file.truncate(entry["size"])
+        return entry
+
+    def create(self, key):
+        self.remove(key)
+        entry = {"name": hashlib.sha1(key.encode()).hexdigest()[:16], "until": None, "check": 0, "rows": 0,
+                 "size": 0, "formats": [], "used": time.time()}
+        open(self.path(entry, "rows"), "wb").close()
+        with self.lock:
+            self.entries[key] = entry
+        return entry
+
+    def read(self, entry):
+        with open(self.path(entry, "rows"), "rb") as file:
+            while True:
+                try:
+                    batch = pickle.load(file)
+                except EOFError:
+                    return
+                yield from batch
+
+    # passes rows through while appending them to the entry
+    def append(self, entry, rows, batch_size, appended):
+        with open(self.path(entry, "rows"), "ab") as file:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                yield row
+                if len(batch) >= batch_size:
+                    pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+                    appended[0] += len(batch)
+                    batch = []
+            if batch:
+                pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+                appended[0] += len(batch)
+
+    def commit(self, key, entry, until, check, rows):
+        entry["until"] = until.isoformat()
+        entry["check"] = check
+        entry["rows"] = rows
+        entry["size"] = os.path.getsize(self.path(entry, "rows"))
+        entry["used"] = time.time()
+        self.evict()
+
+    def keep_file(self, entry, file_format, file_path):
+        shutil.copyfile(file_path, self.path(entry, file_format))
+        if file_format not in entry["formats"]:
+            entry["formats"].append(file_format)
+
+    def drop_files(self, entry, keep=None):
+        for file_format in list(entry["formats"]):
+            if file_format != keep:
+                entry["formats"].remove(file_format)
+                self.remove_file(self.path(entry, file_format))
+
+    def entry_bytes(self, entry):
+        return sum(os.path.getsize(path) for path in [self.path(entry, "rows")] +
+                   [self.path(entry, file_format) for file_format in entry["formats"]] if os.path.exists(path))
+
+    def evict(self):
+        with self.lock:
+            sizes = {key: self.entry_bytes(entry) for key, entry in self.entries.items()}
+            total = sum(sizes.values())
+            for key in sorted(self.entries, key=lambda key: self.entries[key]["used"]):
+                if total <= self.max_bytes:
+                    break
+                if key not in self.busy:
+                    total -= sizes[key]
+                    self.remove_locked(key)
+            self.save()
+
+    def remove(self, key):
+        with self.lock:
+            self.remove_locked(key)
+            self.save()
+
+    def remove_locked(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            for path in [self.path(entry, "rows")] + [self.path(entry, file_format) for file_format in entry["formats"]]:
+                self.remove_file(path)
+
+    def save(self):
+        temp_path = self.index_path + ".part"
+        with open(temp_path, "w") as file:
+            json.dump(self.entries, file)
+        os.replace(temp_path, self.index_path)
+
+    @staticmethod
+    def remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
 class ReportsPopup(QDialog):
-    def __init__(self, parent=None, collection=None):
+    def __init__(self, parent=None, collection=None, fluid_registry=None, archive=None, report_cache=None):
         super(ReportsPopup, self).__init__(parent)
         
-        loadUi("Assets/UiFiles/reportsPopup.ui",self)
+        load_ui("Assets/UiFiles/reportsPopup.ui", self)
         
         self.parent = parent
         self.collection = collection
+        self.fluid_registry = fluid_registry
+        self.archive = archive
+        self.report_cache = report_cache
+        self.export_thread = None
         
         self.setWindowTitle('Download Reports')
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
         
         self.generateDropdownItems()
+
+        now = QDateTime.currentDateTime()
+        self.reportStartEdit.setDateTime(now.addDays(-1))
+        self.reportEndEdit.setDateTime(now)
+        self.reportRangeCheckBox.toggled.connect(self.reportStartEdit.setEnabled)
+        self.reportRangeCheckBox.toggled.connect(self.reportEndEdit.setEnabled)
         
         self.reportsDownloadButton.clicked.connect(self.downloadReport)
+        self.reportsCancelButton.clicked.connect(self.cancelDownload)
         
     def generateDropdownItems(self):
-        try:
-            with open("fluidData.json", "r") as file:
-                data = json.load(file)
-                
-                for entry in data:
-                    self.fluidNameDropdown.addItem(entry)
-                        
-        except (FileNotFoundError, json.JSONDecodeError):
-            print('Error reading the JSON file or the file is empty')
+        self.fluidNameDropdown.addItems(self.fluid_registry.names())
                     
     def downloadReport(self):
         selectedFluid = self.fluidNameDropdown.currentText()
         
-        if self.collection is not None:
-            try: 
-                results = list(self.collection.find({"FluidName": selectedFluid}))
-                
-                if results:
-                    df = pd.DataFrame(results)
-                    
-                    downloads_folder = QStandardPaths.writableLocation(QStandardPaths.DownloadLocation)
-                    
-                    file_name = f"{selectedFluid}_report.xlsx"
-                    file_path = os.path.join(downloads_folder, file_name)
-                    
-                    df.to_excel(file_path, index=False, engine='openpyxl')
-                    
-                    QMessageBox.information(self, "Download Complete", f"{file_name} downloaded successfully to {downloads_folder}")
-                    
+        if self.collection is None:
+            print("Database connection is not available.")
+            return
+
+        if self.export_thread and self.export_thread.isRunning():
+            return
+
+        if self.reportRangeCheckBox.isChecked():
+            start = self.reportStartEdit.dateTime().toPyDateTime()
+            end = self.reportEndEdit.dateTime().toPyDateTime()
+            if start >= end:
+                QMessageBox.warning(self, 'Invalid Range', 'The start time must be before the end time!')
+                return
+            query = report_query(selectedFluid, start, end)
+        else:
+            query = report_query(selectedFluid)
+
+        interval = REPORT_INTERVALS[self.reportIntervalDropdown.currentText()]
+        if interval is None:
+            report_name = "report"
+        elif interval == "summary":
+            report_name = "summary"
+        else:
+            report_name = f"{interval}s_report"
+        # older readings are read from the archive tiers once they have been compacted
+        def plan(part):
+            if self.archive:
+                return self.archive.report_sources(part, interval)
+            return [(self.collection, part, raw_report_pipeline(part, interval))]
+
+        file_format = REPORT_FORMATS[self.reportFormatDropdown.currentText()]
+        downloads_folder = QStandardPaths.writableLocation(QStandardPaths.DownloadLocation)
+        file_name = f"{selectedFluid}_{report_name}.{file_format}"
+        file_path = os.path.join(downloads_folder, file_name)
+
+        self.export_thread = ReportExportThread(self.collection, query, file_path, file_format,
+                                                batch_size=SETTINGS["reports"]["batchSize"], sources=plan(query),
+                                                cache=None if interval == "summary" else self.report_cache,
+                                                interval=interval, plan=plan)
+        self.export_thread.progress.connect(self.updateProgress)
+        self.export_thread.completed.connect(self.downloadFinished)
+        self.export_thread.failed.connect(self.downloadFailed)
+        self.export_thread.finished.connect(self.resetControls)
+
+        self.reportsDownloadButton.setEnabled(False)
+        self.reportsCancelButton.setEnabled(True)
+        self.reportProgressBar.setValue(0)
+        self.reportProgressBar.setVisible(True)
+        self.export_thread.start()
+
+    def cancelDownload(self):
+        if self.export_thread and self.export_thread.isRunning():
+            self.export_thread.cancel()
+
+    def updateProgress(self, written, total):
+        # aggregated reports do not know their row count up front; a zero maximum shows a busy bar
+        self.reportProgressBar.setMaximum(total)
+        self.reportProgressBar.setValue(written)
+
+    def downloadFinished(self, file_path, written):
+        if written:
+            QMessageBox.information(self, "Download Complete", f"{os.path.basename(file_path)} downloaded successfully to {os.path.dirname(file_path)}")
+        else:
+            print(f"No records found for fluid: {self.fluidNameDropdown.currentText()}")
+
+    def downloadFailed(self, message):
+        print(f"Error retrieving data from MongoDB: {message}")
+        QMessageBox.warning(self, 'Download Failed', f'The report could not be downloaded!\n{message}')
+
+    def resetControls(self):
+        self.reportsDownloadButton.setEnabled(True)
+        self.reportsCancelButton.setEnabled(False)
+        self.reportProgressBar.setVisible(False)
+
+    def reject(self):
+        if self.export_thread and self.export_thread.isRunning():
+            self.export_thread.cancel()
+            self.export_thread.wait()
+        super(ReportsPopup, self).reject()
+
+
+def parquet_type(pa, column):
+    if column in ("FluidName", "DeviceId", "RunId"):
+        return pa.string()
+    if column in ("Timestamp", "From", "To"):
+        return pa.timestamp("ms")
+    if column in ("Readings", "TestTemperature"):
+        return pa.int64()
+    return pa.float64()
+
+# readings stored before migrateFluidCollection.py still hold display strings
+def parquet_value(column, value):
+    if not isinstance(value, str) or column in ("FluidName", "DeviceId", "RunId"):
+        return value
+    if column in ("Timestamp", "From", "To"):
+        try:
+            return datetime.strptime(value, TIMESTAMP_FORMAT)
+        except ValueError:
+            return None
+    number = to_number(value)
+    if column in ("Readings", "TestTemperature") and number is not None:
+        return int(number)
+    return number
+
+def counted(rows, count):
+    for row in rows:
+        count[0] += 1
+        yield row
+
+# streams a query cursor into the report file batch by batch, so memory stays flat for any result size
+class ReportExportThread(QThread):
+    progress = pyqtSignal(int, int)  # rows written, total rows
+    completed = pyqtSignal(str, int)  # file path, rows written
+    failed = pyqtSignal(str)
+
+    def __init__(self, collection, query, file_path, file_format, batch_size=5000, pipeline=None, sources=None,
+                 cache=None, interval=None, plan=None):
+        super(ReportExportThread, self).__init__()
+        self.collection = collection
+        self.query = query
+        # (collection, query, pipeline) parts written one after another, see FluidArchive.report_sources
+        self.sources = sources or [(collection, query, pipeline)]
+        self.columns = report_columns(interval, self.sources)
+        # with a cache, plan(query) gives the sources for part of the range and the interval sets the cut
+        self.cache = cache
+        self.interval = interval
+        self.plan = plan
+        self.file_path = file_path
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.cancel_requested = False
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def run(self):
+        # written to a temporary file first so a cancelled or failed export never leaves a partial report
+        temp_path = self.file_path + ".part"
+        try:
+            key = self.cache.key(self.query["FluidName"], *self.bounds(), self.interval) if self.cache else None
+            # readings not yet converted by migrateFluidCollection.py cannot be cut by date, so they skip the cache
+            if key and self.collection.find_one({"FluidName": self.query["FluidName"], "Timestamp": {"$type": "string"}},
+                                                {"_id": 1}):
+                key = None
+            if key and self.cache.acquire(key):
+                try:
+                    written = self.write_cached(key, temp_path)
+                finally:
+                    self.cache.release(key)
+            else:
+                if all(pipeline is None for _, _, pipeline in self.sources):
+                    total = sum(collection.count_documents(query) for collection, query, _ in self.sources)
                 else:
-                    print(f"No records found for fluid: {selectedFluid}")
-                    
-            except Exception as e:
-                print(f"Error retrieving data from MongoDB: {e}")
-                
+                    total = 0
+                rows = self.rows(self.sources)
+                # a summary read from several sources is still one row
+                written = self.write_report(merge_summaries(rows) if self.interval == "summary" else rows, temp_path, total)
+                rows.close()
+        except Exception as e:
+            self.remove_file(temp_path)
+            self.failed.emit(str(e))
+            return
+
+        if self.cancel_requested or not written:
+            self.remove_file(temp_path)
+            if not self.cancel_requested:
+                self.completed.emit(self.file_path, 0)
+            return
+
+        os.replace(temp_path, self.file_path)
+        self.completed.emit(self.file_path, written)
+
+    def bounds(self):
+        bounds = self.query.get("Timestamp", {})
+        return bounds.get("$gte"), bounds.get("$lt")
+
+    def write_cached(self, key, temp_path):
+        fluid = self.query["FluidName"]
+        start, end = self.bounds()
+        latest = None
+        for collection, query, _ in self.sources:
+            document = collection.find_one(query, {"Timestamp": 1}, sort=[("Timestamp", -1)])
+            if document and (latest is None or document["Timestamp"] > latest):
+                latest = document["Timestamp"]
+        if latest is None:
+            return 0
+
+        # rows before the cut are final and cached; the bucket still filling up is read fresh every time
+        resolution = self.interval or 1
+        if end is not None and end <= latest:
+            cut = end
         else:
-            print("Database connection is not available.")
+            cut = floor_time(min(latest + timedelta(seconds=resolution), datetime.now()), resolution)
+            if end is not None:
+                cut = min(cut, end)
+        entry = self.cache.lookup(key, self.collection, fluid)
+        # kept files from before the archive started standing in for raw readings have other columns
+        if entry is None or datetime.fromisoformat(entry["until"]) > cut or entry.get("columns") != list(self.columns):
+            entry = self.cache.create(key)
+            entry["columns"] = list(self.columns)
+            since = start
+        else:
+            since = datetime.fromisoformat(entry["until"])
+
+        # nothing new and nothing still filling up: the kept file is the report
+        if since == cut and (cut > latest or cut == end) and self.file_format in entry["formats"]:
+            shutil.copyfile(self.cache.path(entry, self.file_format), temp_path)
+            self.cache.outcomes["hit"].inc()
+            self.cache.commit(key, entry, cut, entry["check"], entry["rows"])
+            return entry["rows"]
+
+        appended = [0]
+        fresh = self.rows(self.plan(report_query(fluid, since, cut))) if since is None or since < cut else iter(())
+        fresh = self.cache.append(entry, fresh, self.batch_size, appended)
+        tail = self.rows(self.plan(report_query(fluid, cut, end))) if end is None or cut < end else iter(())
+        tailed = [0]
+        tail = counted(tail, tailed)
+
+        if self.file_format != "csv":
+            written = self.write_report(itertools.chain(self.cache.read(entry), fresh, tail), temp_path, 0)
+        elif "csv" in entry["formats"]:
+            shutil.copyfile(self.cache.path(entry, "csv"), temp_path)
+            written = self.append_csv(entry, fresh, tail, temp_path, entry["rows"])
+        else:
+            # the final rows are kept as they are, the tail goes on the download only
+            written = self.write_csv(itertools.chain(self.cache.read(entry), fresh), temp_path, 0)
+            if written and not self.cancel_requested:
+                self.cache.keep_file(entry, "csv", temp_path)
+                written = self.append_csv(entry, iter(()), tail, temp_path, written)
+            elif not self.cancel_requested:
+                written = self.write_csv(tail, temp_path, 0)
+        fresh.close()
+        tail.close()
+        if self.cancel_requested:
+            self.cache.drop_files(entry)
+            return written
+
+        if appended[0]:
+            self.cache.drop_files(entry, keep="csv" if self.file_format == "csv" else None)
+        # the finished file is only worth keeping when it holds nothing but cached rows
+        if written and not tailed[0] and self.file_format != "csv" and self.file_format not in entry["formats"]:
+            self.cache.keep_file(entry, self.file_format, temp_path)
+        if entry["until"] is None:
+            self.cache.outcomes["miss"].inc()
+        else:
+            self.cache.outcomes["refresh" if appended[0] else "hit"].inc()
+        self.cache.commit(key, entry, cut, self.cache.check_count(self.collection, fluid, cut),
+                          entry["rows"] + appended[0])
+        return written
+
+    # the kept CSV gets the new final rows, the download gets those plus the tail
+    def append_csv(self, entry, fresh, tail, temp_path, written):
+        kept_path = self.cache.path(entry, "csv")
+        columns = self.columns
+        with open(temp_path, "a", newline="") as file, open(kept_path, "a", newline="") as kept:
+            writer = csv.writer(file)
+            keeper = csv.writer(kept)
+            for batch in self.batches(fresh):
+                rows = [[document.get(column) for column in columns] for document in batch]
+                writer.writerows(rows)
+                keeper.writerows(rows)
+                written += len(batch)
+                self.progress.emit(written, 0)
+            for batch in self.batches(tail):
+                writer.writerows([document.get(column) for column in columns] for document in batch)
+                written += len(batch)
+                self.progress.emit(written, 0)
+        return written
+
+    def rows(self, sources):
+        for collection, query, pipeline in sources:
+            if pipeline is None:
+                cursor = collection.find(query, {"_id": 0}).batch_size(self.batch_size)
+            else:
+                cursor = collection.aggregate(pipeline, allowDiskUse=True, batchSize=self.batch_size)
+            try:
+                yield from cursor
+            finally:
+                cursor.close()
+
+    def batches(self, cursor):
+        while not self.cancel_requested:
+            batch = list(itertools.islice(cursor, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def write_report(self, cursor, path, total):
+        if self.file_format == "csv":
+            return self.write_csv(cursor, path, total)
+        if self.file_format == "parquet":
+            return self.write_parquet(cursor, path, total)
+        return self.write_excel(cursor, path, total)
+
+    def write_excel(self, cursor, path, total):
+        from openpyxl import Workbook
+
+        # write-only workbooks stream rows to disk instead of keeping every cell in memory
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        columns = self.columns
+        sheet.append(columns)
+        written = 0
+        for batch in self.batches(cursor):
+            for document in batch:
+                sheet.append([document.get(column) for column in columns])
+            written += len(batch)
+            self.progress.emit(written, total)
+
+        if written:
+            workbook.save(path)
+        return written
+
+    def write_csv(self, cursor, path, total):
+        columns = self.columns
+        written = 0
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for batch in self.batches(cursor):
+                writer.writerows([document.get(column) for column in columns] for document in batch)
+                written += len(batch)
+                self.progress.emit(written, total)
+        return written
+
+    def write_parquet(self, cursor, path, total):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs the pyarrow package")
+
+        # the schema is fixed up front: a column that is null throughout the first batch still has its real type
+        schema = pa.schema([(column, parquet_type(pa, column)) for column in self.columns])
+        parquet_writer = None
+        written = 0
+        try:
+            for batch in self.batches(cursor):
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(path, schema)
+                columns = {column: [parquet_value(column, document.get(column)) for document in batch]
+                           for column in self.columns}
+                parquet_writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+                written += len(batch)
+                self.progress.emit(written, total)
+        finally:
+            if parquet_writer is not None:
+                parquet_writer.close()
+        return written
+
+    def remove_file(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
 
+# latest value of every measurement, written by the acquisition thread and read by the card view and persistence.
+# Each field carries a version so the view only repaints the cards that changed.
+class MeasurementModel:
+    def __init__(self, values=None):
+        self.lock = threading.Lock()
+        self.values = dict(values or {})
+        self.versions = {field: 0 for field in self.values}
+
+    def update(self, **values):
+        with self.lock:
+            for field, value in values.items():
+                if self.values.get(field) != value:
+                    self.values[field] = value
+                    self.versions[field] = self.versions.get(field, 0) + 1
+
+    def get(self, field):
+        with self.lock:
+            return self.values.get(field)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values), dict(self.versions)
 
 
 class WorkerThread(QThread):
-    data_received = pyqtSignal(str)  # Signal emitted when data is received
+    frames_received = pyqtSignal(object)  # FRAME_DTYPE array with every status frame since the last refresh
     finished = pyqtSignal()  # Signal emitted when the thread finishes
 
-    def __init__(self, serial_connection):
+    def __init__(self, serial_engine, poll_interval=1.0, refresh_interval=0.1, measurements=None):
         super().__init__()
-        self.serial_connection = serial_connection
+        self.serial_engine = serial_engine
+        self.measurements = measurements
+        self.poll_interval = poll_interval
+        self.refresh_interval = refresh_interval
+        self.replies = queue.Queue()
+        self.request_ids = set()
+        self.request_lock = threading.Lock()
         self.stop_requested = False
+        self.parse_latency = METRICS.histogram("iocl_parse_block_seconds", "Time to parse one block of status replies",
+                                               port=serial_engine.port_name)
+        self.frames_metric = METRICS.counter("iocl_frames_received_total", "Status frames parsed by the worker",
+                                             port=serial_engine.port_name)
+        # DirectConnection: replies are queued from the engine thread without touching the GUI loop
+        self.serial_engine.response_received.connect(self.on_response, Qt.DirectConnection)
+        self.serial_engine.command_failed.connect(self.on_failed, Qt.DirectConnection)
 
     def run(self):
         count = 0
+        pending = []
+        next_poll = time.monotonic()
+        next_refresh = next_poll + self.refresh_interval
         while not self.stop_requested:
-            data = "3"
-            self.serial_connection.write(data.encode())
-            self.sleep(1)  # Use QThread's sleep method for smoother UI response
-            count += 1
-            if self.serial_connection and self.serial_connection.in_waiting > 0:
-                serialData = self.serial_connection.readline().decode('utf-8').strip()
-                self.data_received.emit(serialData) 
-
-                if count == 3:
-                    values = serialData.split(',')
-                    second_data = values[0].strip()
-                    if second_data == "1":  # Compare to string "1"
-                        print("oil is there")
-                        # break
-                    else:
-                        # print("no oil")
-                        print(values)
-                        count = 2
+            now = time.monotonic()
+            if now >= next_poll:
+                # requests are pipelined up to the engine's in-flight window instead of one per reply
+                with self.request_lock:
+                    if len(self.request_ids) < self.serial_engine.max_in_flight:
+                        self.request_ids.add(self.serial_engine.submit("3"))
+                next_poll = max(next_poll + self.poll_interval, now)
+
+            if now >= next_refresh:
+                # the GUI gets one parsed block per refresh however fast the analyser is sampled
+                if pending:
+                    parseStarted = time.perf_counter()
+                    frames = parse_status_block(pending)
+                    self.parse_latency.observe(time.perf_counter() - parseStarted)
+                    self.frames_metric.inc(len(pending))
+                    pending = []
+                    if self.measurements is not None:
+                        self.measurements.update(Tandelta=to_number(frames["tandelta"][-1]),
+                                                 WearDebris=to_number(frames["wearDebris"][-1]),
+                                                 Temperature=to_number(frames["temperature"][-1]))
+                    self.frames_received.emit(frames)
+
+                    count += 1
+                    if count == 3:
+                        second_data = frames["status"][-1]
+                        if second_data == 1:
+                            log_event(logging.INFO, "worker.oil_present", port=self.serial_engine.port_name)
+                            # break
+                        else:
+                            # print("no oil")
+                            log_event(logging.INFO, "worker.no_oil", port=self.serial_engine.port_name, frame=str(frames[-1]))
+                            count = 2
+                next_refresh = max(next_refresh + self.refresh_interval, now)
 
+            try:
+                pending.append(self.replies.get(timeout=max(0.0, min(next_poll, next_refresh) - time.monotonic())))
+            except queue.Empty:
+                continue
+
+        self.serial_engine.response_received.disconnect(self.on_response)
+        self.serial_engine.command_failed.disconnect(self.on_failed)
         self.finished.emit()  # Emit finished signal when the loop ends
 
+    def on_response(self, request_id, serialData):
+        with self.request_lock:
+            if request_id not in self.request_ids:
+                return
+            self.request_ids.discard(request_id)
+        self.replies.put((time.time(), serialData))
+
+    def on_failed(self, request_id, reason):
+        with self.request_lock:
+            self.request_ids.discard(request_id)
+
     def stop(self):
         self.stop_requested = True
 
 
+# polls the analyser oil status ("3") from a QTimer so the GUI thread never blocks
+class OilStatusProbe(QObject):
+    progress = pyqtSignal(int, int, str)  # attempt, elapsed ms, last status line
+    oil_status = pyqtSignal(str)  # "1" oil present, "0" no oil
+    failed = pyqtSignal(str)
+
+    def __init__(self, serial_engine, poll_interval_ms=1000, timeout_ms=15000, max_retries=3, parent=None):
+        super(OilStatusProbe, self).__init__(parent)
+        self.serial_engine = serial_engine
+        self.poll_interval_ms = poll_interval_ms
+        self.timeout_ms = timeout_ms
+        self.max_retries = max_retries
+
+        self.attempt = 0
+        self.request_id = None
+        self.elapsed = QElapsedTimer()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.poll)
+
+    def is_running(self):
+        return self.timer.isActive()
+
+    def start(self):
+        self.attempt = 1
+        self.request_id = None
+        self.serial_engine.response_received.connect(self.on_response)
+        self.serial_engine.command_failed.connect(self.on_command_failed)
+        self.serial_engine.error.connect(self.on_error)
+        self.elapsed.start()
+        self.send_request()
+        self.timer.start(self.poll_interval_ms)
+
+    def stop(self):
+        if self.timer.isActive():
+            self.timer.stop()
+            self.serial_engine.response_received.disconnect(self.on_response)
+            self.serial_engine.command_failed.disconnect(self.on_command_failed)
+            self.serial_engine.error.disconnect(self.on_error)
+        self.request_id = None
+
+    def cancel(self):
+        if self.timer.isActive():
+            log_event(logging.INFO, "probe.cancelled", attempt=self.attempt)
+        self.stop()
+
+    def send_request(self):
+        self.request_id = self.serial_engine.submit("3")
+
+    def on_command_failed(self, request_id, reason):
+        # a timed out or cancelled request frees the slot for the next tick
+        if request_id == self.request_id:
+            self.request_id = None
+
+    def on_response(self, request_id, serialData):
+        if request_id != self.request_id:
+            return
+
+        log_event(logging.INFO, "probe.oil_status", reply=str(serialData))
+        self.progress.emit(self.attempt, self.elapsed.elapsed(), str(serialData))
+        self.stop()
+        self.oil_status.emit(str(reply_status(serialData)))
+
+    def on_error(self, message):
+        self.stop()
+        self.failed.emit(f"Serial error: {message}")
+
+    def poll(self):
+        if self.elapsed.elapsed() >= self.timeout_ms:
+            if self.attempt >= self.max_retries:
+                self.stop()
+                self.failed.emit(f"No oil status received after {self.attempt} attempts")
+                return
+            self.attempt += 1
+            self.elapsed.restart()
+
+        self.progress.emit(self.attempt, self.elapsed.elapsed(), "")
+        # one request outstanding at a time, as in ProcessController.poll
+        if self.request_id is None:
+            self.send_request()
+
+# binary replies arrive as tuples, CSV replies as "status,tandelta,temperature,aux,wearDebris"
+def status_values(reply):
+    return list(reply) if isinstance(reply, tuple) else parse_csv_frame(reply)
+
+CYCLE_DRAIN = "drain"
+CYCLE_FILL = "fill"
+CYCLE_COOL = "cool"
+
+class ProcessError(Exception):
+    pass
+
+# drain ("1"), fill ("0") and cool ("7", poll until the temperature drops, "8") cycles as state machines.
+# A cycle is a generator that yields what it waits for (a command reply or a status condition); engine
+# replies and timers resume it, so nothing waits on the GUI thread and the serial I/O stays on the engine thread.
+class ProcessController(QObject):
+    stage = pyqtSignal(str, str)  # cycle, what is happening
+    reading = pyqtSignal(str, float, float)  # cycle, oil status, temperature
+    finished = pyqtSignal(str, str)  # cycle, result
+    failed = pyqtSignal(str, str)  # cycle, reason
+
+    def __init__(self, serial_engine, poll_interval_ms=1000, command_timeout_ms=5000, drain_timeout_ms=180000,
+                 fill_timeout_ms=180000, cool_timeout_ms=900000, confirm_timeout_ms=15000, cool_below=50.0,
+                 max_temperature=120.0, parent=None):
+        super(ProcessController, self).__init__(parent)
+        self.serial_engine = serial_engine
+        self.poll_interval_ms = poll_interval_ms
+        self.command_timeout_ms = command_timeout_ms
+        self.drain_timeout_ms = drain_timeout_ms
+        self.fill_timeout_ms = fill_timeout_ms
+        self.cool_timeout_ms = cool_timeout_ms
+        self.confirm_timeout_ms = confirm_timeout_ms
+        self.cool_below = cool_below
+        self.max_temperature = max_temperature
+
+        self.cycle_name = None
+        self.cycle = None
+        self.step = None
+        self.request_id = None
+        self.cooling = False
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.poll)
+        self.deadline_timer = QTimer(self)
+        self.deadline_timer.setSingleShot(True)
+        self.deadline_timer.timeout.connect(self.on_deadline)
+
+        self.serial_engine.response_received.connect(self.on_response)
+        self.serial_engine.command_failed.connect(self.on_command_failed)
+        self.serial_engine.connection_lost.connect(self.on_connection_lost)
+
+    def is_running(self):
+        return self.cycle is not None
+
+    def start_drain(self):
+        return self.start(CYCLE_DRAIN, self.drain_cycle())
+
+    def start_fill(self):
+        return self.start(CYCLE_FILL, self.fill_cycle())
+
+    def start_cool(self):
+        return self.start(CYCLE_COOL, self.cool_cycle())
+
+    def start(self, name, cycle):
+        # interlock: one cycle at a time per analyser
+        if self.cycle is not None:
+            return False
+        self.cycle_name = name
+        self.cycle = cycle
+        self.advance(None)
+        return True
+
+    def abort(self):
+        if self.cycle is not None:
+            self.fail("aborted by the operator")
+
+    # steps a cycle can yield
+    def command(self, data, timeout_ms, message, expects_reply=True):
+        return ("command", data, timeout_ms, message, expects_reply)
+
+    def wait_for(self, condition, timeout_ms, message):
+        return ("poll", condition, timeout_ms, message)
+
+    def drain_cycle(self):
+        values = yield self.wait_for(lambda values: True, self.command_timeout_ms, "Checking the oil level")
+        if values[0] != 1:
+            return "The cell is already empty"
+        yield self.command("1", self.drain_timeout_ms, "Oil is Draining, Please Wait!")
+        yield self.wait_for(lambda values: values[0] == 0, self.confirm_timeout_ms, "Checking the cell is empty")
+        return "Oil drained"
+
+    def fill_cycle(self):
+        values = yield self.wait_for(lambda values: True, self.command_timeout_ms, "Checking the oil level")
+        if values[0] == 1:
+            raise ProcessError("oil is already in the cell")
+        yield self.command("0", self.fill_timeout_ms, "Oil is being filled, Please wait!")
+        yield self.wait_for(lambda values: values[0] == 1, self.confirm_timeout_ms, "Checking the cell is full")
+        return "Oil filled"
+
+    def cool_cycle(self):
+        values = yield self.wait_for(lambda values: True, self.command_timeout_ms, "Reading the oil temperature")
+        if not values[2] > self.cool_below:
+            return f"Oil is already below {self.cool_below:g} °C"
+        # the analyser does not acknowledge "7"/"8"; the temperature readings show the cooler working
+        self.cooling = True
+        yield self.command("7", self.command_timeout_ms, "Starting the cooler", expects_reply=False)
+        yield self.wait_for(lambda values: values[2] < self.cool_below, self.cool_timeout_ms,
+                            f"Cooling the oil below {self.cool_below:g} °C")
+        yield self.command("8", self.command_timeout_ms, "Stopping the cooler", expects_reply=False)
+        self.cooling = False
+        return f"Oil cooled below {self.cool_below:g} °C"
+
+    def advance(self, value):
+        self.poll_timer.stop()
+        self.deadline_timer.stop()
+        self.request_id = None
+        try:
+            self.step = self.cycle.send(value)
+        except StopIteration as result:
+            name = self.cycle_name
+            self.end()
+            self.finished.emit(name, result.value or "")
+            return
+        except ProcessError as e:
+            self.fail(str(e))
+            return
+
+        self.stage.emit(self.cycle_name, self.step[3])
+        self.deadline_timer.start(self.step[2])
+        if self.step[0] == "command":
+            _, data, timeout_ms, _, expects_reply = self.step
+            self.request_id = self.serial_engine.submit(data, priority=PRIORITY_CONTROL, timeout=timeout_ms / 1000,
+                                                        expects_reply=expects_reply)
+            if not expects_reply:
+                QTimer.singleShot(0, lambda: self.advance(None) if self.cycle is not None else None)
+        else:
+            self.poll()
+            self.poll_timer.start(self.poll_interval_ms)
+
+    def poll(self):
+        # one status request outstanding at a time; a missed reply is simply asked for again
+        if self.request_id is None:
+            self.request_id = self.serial_engine.submit("3", timeout=self.poll_interval_ms / 1000)
+
+    def on_response(self, request_id, reply):
+        if self.cycle is None or request_id != self.request_id:
+            return
+        self.request_id = None
+        if self.step[0] == "command":
+            self.advance(reply)
+            return
+
+        values = status_values(reply)
+        self.reading.emit(self.cycle_name, values[0], values[2])
+        if values[2] > self.max_temperature:
+            self.fail(f"oil temperature {values[2]:.1f} °C is above the {self.max_temperature:g} °C limit")
+        elif self.step[1](values):
+            self.advance(values)
+
+    def on_command_failed(self, request_id, reason):
+        if self.cycle is None or request_id != self.request_id:
+            return
+        self.request_id = None
+        if self.step[0] == "command":
+            self.fail(f"the analyser did not answer \"{self.step[1]}\" ({reason})")
+
+    def on_connection_lost(self, message):
+        if self.cycle is not None:
+            self.fail(f"serial connection lost: {message}")
+
+    def on_deadline(self):
+        self.fail(f"no progress after {self.step[2] / 1000:g} s ({self.step[3]})")
+
+    def fail(self, reason):
+        name = self.cycle_name
+        self.cycle.close()
+        self.end()
+        # leave the analyser safe: cooler off, pumps stopped. Commands queue up if the port is down.
+        if self.cooling:
+            self.serial_engine.submit("8", priority=PRIORITY_STOP, expects_reply=False)
+            self.cooling = False
+        if name in (CYCLE_DRAIN, CYCLE_FILL):
+            self.serial_engine.submit("2", priority=PRIORITY_STOP, expects_reply=False)
+        log_event(logging.WARNING, "process.failed", cycle=name, reason=reason)
+        self.failed.emit(name, reason)
+
+    def end(self):
+        self.poll_timer.stop()
+        self.deadline_timer.stop()
+        self.cycle_name = None
+        self.cycle = None
+        self.step = None
+        self.request_id = None
+
+# oilDrainPage.ui / oilFillPage.ui laid over an analyser page while a cycle runs
+class ProcessScreen(QMainWindow):
+    def __init__(self, ui_path, parent):
+        super(ProcessScreen, self).__init__(parent)
+        load_ui(ui_path, self)
+        self.setWindowFlags(Qt.Widget)
+        self.setStyleSheet("QMainWindow { background-color: rgba(0, 0, 0, 220); }")
+        self.menubar.hide()
+        self.statusbar.hide()
+        self.label.setAlignment(Qt.AlignCenter)
+        self.abortButton = QPushButton('Abort', self)
+        self.abortButton.setStyleSheet("QPushButton { background-color: red; color: white; font-weight: bold; padding: 8px 24px; }")
+        self.centralwidget.layout().addWidget(self.abortButton, 2, 1, Qt.AlignHCenter | Qt.AlignTop)
+        self.hide()
+
+    def cover(self, widget):
+        self.setGeometry(widget.rect())
+        self.raise_()
+        self.show()
+
+# drainWaitDialog.ui, used for the cooling cycle; closing it aborts the cycle
+class ProcessDialog(QDialog):
+    def __init__(self, title, parent=None):
+        super(ProcessDialog, self).__init__(parent)
+        load_ui("Assets/UiFiles/drainWaitDialog.ui", self)
+        self.setWindowTitle(title)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.controller = None
+
+    def reject(self):
+        if self.controller and self.controller.is_running():
+            self.controller.abort()
+        super(ProcessDialog, self).reject()
+
+
+def non_duplicate_errors(e):
+    # duplicate _id errors mean the reading is already stored, e.g. from an earlier replay
+    return [error for error in e.details.get('writeErrors', []) if error.get('code') != 11000]
+
+def error_codes(errors):
+    return dict(collections.Counter(error.get('code') for error in errors))
+
+# append-only spool for readings that could not reach MongoDB.
+# Segments hold length-prefixed BSON records and are deleted once replayed. Readings MongoDB refused outright
+# go to .rejected dead-letter segments instead, which are never replayed since they would only fail again.
+class ReadingSpool:
+    def __init__(self, directory="spool", segment_bytes=4 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.current = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def segments(self):
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.spool'))
+
+    def has_pending(self):
+        return bool(self.segments())
+
+    def append(self, documents):
+        if self.current is None or self.current.tell() >= self.segment_bytes:
+            self.close_segment()
+            self.current = open(os.path.join(self.directory, f"{time.time_ns()}.spool"), "ab")
+
+        self.write_records(self.current, documents)
+
+    def reject(self, documents):
+        with open(os.path.join(self.directory, f"{time.time_ns()}.rejected"), "ab") as file:
+            self.write_records(file, documents)
+
+    def rejected(self):
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.rejected'))
+
+    def write_records(self, file, documents):
+        records = []
+        for document in documents:
+            record = bson.encode(document)
+            records.append(struct.pack("<I", len(record)))
+            records.append(record)
+        file.write(b"".join(records))
+        file.flush()
+        os.fsync(file.fileno())
+
+    def close_segment(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+    def read_segment(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+
+        documents = []
+        pos = 0
+        while pos + 4 <= len(data):
+            (length,) = struct.unpack_from("<I", data, pos)
+            if pos + 4 + length > len(data):
+                break  # torn write at the end of the segment
+            documents.append(bson.decode(data[pos + 4:pos + 4 + length]))
+            pos += 4 + length
+        return documents
+
+    def replay(self, collection, batch_size=1000):
+        # readings keep the _id they were given when spooled, so a replay interrupted half way can simply run again
+        self.close_segment()
+        replayed = 0
+        rejected = 0
+        for path in self.segments():
+            documents = self.read_segment(path)
+            for start in range(0, len(documents), batch_size):
+                chunk = documents[start:start + batch_size]
+                try:
+                    collection.insert_many(chunk, ordered=False)
+                except BulkWriteError as e:
+                    errors = non_duplicate_errors(e)
+                    if errors:
+                        self.reject([chunk[error['index']] for error in errors])
+                        rejected += len(errors)
+                        log_event(logging.ERROR, "spool.rejected", readings=len(errors), codes=error_codes(errors),
+                                  error=errors[0].get('errmsg'))
+                    replayed += len(chunk) - len(errors)
+                    continue
+                replayed += len(chunk)
+            os.remove(path)
+        return replayed, rejected
+
+
+# one test run on one analyser. Everything in a stored document except the measurements is fixed when the run
+# starts, so it is worked out once here; every reading keeps its own session, so readings still queued from the
+# previous run are stored under that run even after the next one has started.
+class TestSession:
+    def __init__(self, fluid_name, temperature=None, device_id=None):
+        self.fluid_name = fluid_name
+        self.temperature = temperature
+        self.device_id = device_id
+        # the fluid registry stores "name-temperature"
+        self.fluid_key = fluid_name if temperature is None else f"{fluid_name}-{temperature}"
+        self.run_id = str(ObjectId())
+        # the fields after the measurements, in the order reports show them
+        self.template = {"DeviceId": device_id, "TestTemperature": temperature, "RunId": self.run_id}
+
+    @classmethod
+    def from_key(cls, fluid_key, device_id=None):
+        # resuming with the fluid already in the cell: only the registry key is known
+        name, _, temperature = fluid_key.rpartition("-")
+        if not name or not temperature.isdigit():
+            return cls(fluid_key, device_id=device_id)
+        return cls(name, int(temperature), device_id=device_id)
+
+    def readings(self, frames, density, viscosity):
+        return [Reading(self, timestamp, density, viscosity, tandelta, wear_debris)
+                for timestamp, tandelta, wear_debris in zip(frames["timestamp"].tolist(), frames["tandelta"].tolist(),
+                                                            frames["wearDebris"].tolist())]
+
+    def document(self, reading):
+        document = {
+            "_id": reading.id,
+            "FluidName": self.fluid_key,
+            "Density": reading.density,
+            "Viscosity": reading.viscosity,
+            "Tandelta": to_number(reading.tandelta),
+            "WearDebris": to_number(reading.wear_debris),
+            "Timestamp": datetime.fromtimestamp(reading.timestamp)
+        }
+        document.update(self.template)
+        return document
+
+# a single frame of a session; turned into a document on the writer thread
+class Reading:
+    __slots__ = ("session", "id", "timestamp", "density", "viscosity", "tandelta", "wear_debris")
+
+    def __init__(self, session, timestamp, density, viscosity, tandelta, wear_debris):
+        self.session = session
+        # the _id is fixed before the first attempt so spooled readings replay idempotently
+        self.id = ObjectId()
+        self.timestamp = timestamp
+        self.density = density
+        self.viscosity = viscosity
+        self.tandelta = tandelta
+        self.wear_debris = wear_debris
+
+    def document(self):
+        return self.session.document(self)
+
+# appends reading blocks to the column store off the GUI thread, as MongoWriter does for MongoDB
+class ColumnStoreWriter(QThread):
+    def __init__(self, store, max_queue=1000):
+        super(ColumnStoreWriter, self).__init__()
+        self.store = store
+        self.blocks = queue.Queue(maxsize=max_queue)
+        self.running = True
+        self.dropped = 0
+        METRICS.gauge("iocl_store_queue_depth", "Reading blocks waiting for the column store", self.blocks.qsize)
+        METRICS.gauge("iocl_store_dropped_total", "Reading blocks dropped because the column store queue was full",
+                      lambda: self.dropped, kind="counter")
+
+    def submit(self, session, frames, density, viscosity):
+        try:
+            self.blocks.put_nowait((session, frames, density, viscosity))
+        except queue.Full:
+            self.dropped += 1
+            log_event(logging.WARNING, "store.dropped", dropped=self.dropped)
+            return False
+        return True
+
+    def run(self):
+        while self.running or not self.blocks.empty():
+            try:
+                block = self.blocks.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                self.store.append(*block)
+            except OSError as e:
+                log_event(logging.ERROR, "store.append_failed", error=str(e))
+        self.store.close()
+
+    def flush(self):
+        self.running = False
+        self.wait()
+
+# write-behind buffer for readings: documents are batched into insert_many off the GUI thread.
+# While MongoDB is unreachable batches go to the spool and are replayed once a ping succeeds.
+class MongoWriter(QThread):
+    def __init__(self, collection, batch_size=200, flush_interval=1.0, max_queue=10000,
+                 spool=None, retry_interval=5.0, available=True):
+        super(MongoWriter, self).__init__()
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.documents = queue.Queue(maxsize=max_queue)
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self.available = available
+        self.next_retry = 0.0
+        self.running = True
+
+        self.stats_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.last_batch_ms = 0.0
+
+        self.write_latency = METRICS.histogram("iocl_db_write_seconds", "insert_many round trip per batch")
+        self.batch_sizes = METRICS.histogram("iocl_db_batch_size", "Readings per insert_many batch",
+                                             buckets=(1, 10, 50, 100, 200, 500, 1000, 5000))
+        METRICS.gauge("iocl_writer_queue_depth", "Readings waiting for the next batch", self.documents.qsize)
+        for name, help in (("written", "Readings stored in MongoDB"),
+                           ("dropped", "Readings dropped because the writer queue was full"),
+                           ("failed", "Readings that could neither be written nor spooled"),
+                           ("spooled", "Readings spooled to disk while MongoDB was unavailable"),
+                           ("replayed", "Spooled readings replayed to MongoDB"),
+                           ("rejected", "Readings MongoDB refused, set aside in the spool's dead-letter segments")):
+            METRICS.gauge(f"iocl_readings_{name}_total", help, lambda name=name: getattr(self, name), kind="counter")
+
+    def submit(self, document):
+        # the _id is fixed before the first attempt so spooled readings replay idempotently
+        if not isinstance(document, Reading):
+            document.setdefault('_id', ObjectId())
+        try:
+            self.documents.put_nowait(document)
+        except queue.Full:
+            # bounded memory: when the database falls behind, the newest readings are dropped and counted
+            with self.stats_lock:
+                self.dropped += 1
+            return False
+
+        depth = self.documents.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def run(self):
+        if self.available and self.spool and self.spool.has_pending():
+            self.replay_spool()
+
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while self.running:
+            try:
+                batch.append(self.documents.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+
+            if not self.available and time.monotonic() >= self.next_retry:
+                self.check_connection()
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self.write_batch(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+        # final flush on shutdown
+        while True:
+            try:
+                batch.append(self.documents.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        self.write_batch(batch)
+        if self.spool:
+            self.spool.close_segment()
+
+    def check_connection(self):
+        self.next_retry = time.monotonic() + self.retry_interval
+        try:
+            self.collection.database.client.admin.command('ping')
+        except PyMongoError:
+            return
+
+        print('MongoDB connection restored!')
+        self.available = True
+        self.replay_spool()
+
+    def replay_spool(self):
+        if not self.spool:
+            return
+        try:
+            replayed, rejected = self.spool.replay(self.collection, self.batch_size)
+        except PyMongoError as e:
+            print(f"Error replaying spooled readings: {e}")
+            self.available = False
+            return
+
+        if replayed:
+            print(f"Replayed {replayed} spooled readings to MongoDB")
+        with self.stats_lock:
+            self.replayed += replayed
+            self.rejected += rejected
+
+    def write_batch(self, batch):
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        batch = [item.document() if isinstance(item, Reading) else item for item in batch]
+        unsaved = []
+        rejected = []
+        if self.available:
+            try:
+                self.collection.insert_many(batch, ordered=False)
+                self.write_latency.observe(time.perf_counter() - started)
+                self.batch_sizes.observe(len(batch))
+            except BulkWriteError as e:
+                # refused documents would fail the same way on every replay, so they skip the spool
+                errors = non_duplicate_errors(e)
+                rejected = [batch[error['index']] for error in errors]
+                log_event(logging.ERROR, "writer.batch_failed", failed=len(rejected), batch=len(batch),
+                          codes=error_codes(errors), error=errors[0].get('errmsg') if errors else None)
+            except PyMongoError as e:
+                unsaved = batch
+                self.available = False
+                self.next_retry = time.monotonic() + self.retry_interval
+                log_event(logging.ERROR, "writer.unavailable", error=str(e))
+        else:
+            unsaved = batch
+
+        spooled = 0
+        if unsaved and self.spool:
+            try:
+                self.spool.append(unsaved)
+                spooled = len(unsaved)
+            except OSError as e:
+                log_event(logging.ERROR, "writer.spool_failed", readings=len(unsaved), error=str(e))
+
+        setAside = 0
+        if rejected and self.spool:
+            try:
+                self.spool.reject(rejected)
+                setAside = len(rejected)
+            except OSError as e:
+                log_event(logging.ERROR, "writer.spool_failed", readings=len(rejected), error=str(e))
+
+        with self.stats_lock:
+            self.written += len(batch) - len(unsaved) - len(rejected)
+            self.spooled += spooled
+            self.rejected += setAside
+            self.failed += len(unsaved) - spooled + len(rejected) - setAside
+            self.batches += 1
+            self.last_batch_ms = (time.perf_counter() - started) * 1000
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "available": self.available,
+                "queued": self.documents.qsize(),
+                "maxQueued": self.max_depth,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "spooled": self.spooled,
+                "replayed": self.replayed,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "lastBatchMs": round(self.last_batch_ms, 2)
+            }
+
+    def flush(self):
+        self.running = False
+        self.wait()
+
+
+# fixed-size history for one trend chart; samples are copied into preallocated arrays
+class TrendBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full(capacity, np.nan, dtype=np.float64)
+        self.head = 0  # next write position
+        self.size = 0
+
+    def extend(self, times, values):
+        if len(times) > self.capacity:
+            times = times[-self.capacity:]
+            values = values[-self.capacity:]
+
+        count = len(times)
+        first = min(count, self.capacity - self.head)
+        self.times[self.head:self.head + first] = times[:first]
+        self.values[self.head:self.head + first] = values[:first]
+        if count > first:
+            self.times[:count - first] = times[first:]
+            self.values[:count - first] = values[first:]
+
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def ordered(self):
+        if self.size < self.capacity:
+            return self.times[:self.size], self.values[:self.size]
+        return (np.concatenate((self.times[self.head:], self.times[:self.head])),
+                np.concatenate((self.values[self.head:], self.values[:self.head])))
+
+# keeps the min and max of every bucket so spikes survive when hours of samples are drawn in a few hundred points
+def decimate_minmax(times, values, max_points):
+    count = len(times)
+    buckets = max_points // 2
+    if count <= max_points or buckets == 0:
+        return times, values
+
+    per_bucket = count // buckets
+    start = count - buckets * per_bucket  # drop the oldest remainder so the newest sample is always drawn
+    bucket_times = times[start:].reshape(buckets, per_bucket)
+    bucket_values = values[start:].reshape(buckets, per_bucket)
+
+    decimated_times = np.empty(buckets * 2)
+    decimated_values = np.empty(buckets * 2)
+    decimated_times[0::2] = bucket_times[:, 0]
+    decimated_times[1::2] = bucket_times[:, -1]
+    decimated_values[0::2] = np.fmin.reduce(bucket_values, axis=1)
+    decimated_values[1::2] = np.fmax.reduce(bucket_values, axis=1)
+    return decimated_times, decimated_values
+
+CARD_LABELS = {
+    "Density": "densityCardLabel",
+    "Viscosity": "viscosityCardLabel",
+    "Tandelta": "tandelta2CardLabel",
+    "WearDebris": "wearDebrisCardLabel"
+}
+
+# trend charts sit under the value and unit labels of each card
+CARD_TREND_FRAMES = {
+    "Density": "frame_15",
+    "Viscosity": "frame_16",
+    "Tandelta": "frame_19",
+    "WearDebris": "frame_20"
+}
 
-        
 # main page function
 class MainPageUI(QMainWindow):
-    def __init__(self, mainUI, collection, serial_connection):
+    def __init__(self, mainUI, collection, serial_connection, mongo_writer=None, fluid_registry=None, device_id=None,
+                 column_writer=None):
        
 
         super(MainPageUI, self).__init__()
-        loadUi("Assets/UiFiles/finalisedPage.ui", self)
-
-        self.setStyleSheet("QMainWindow {"
-                           "background-image: url('Assets/Images/homepage.png');"  
-                           "background-position: center;"
-                           "}")
+        load_ui("Assets/UiFiles/finalisedPage.ui", self)
+        # the background is painted from the asset cache, see paintEvent
 
         self.mainUI = mainUI
         self.collection = collection
+        self.mongo_writer = mongo_writer
+        self.fluid_registry = fluid_registry
+        self.column_writer = column_writer
+        self.device_id = device_id
+        self.block_latency = METRICS.histogram("iocl_gui_block_seconds", "GUI thread time to chart and queue one block of frames",
+                                               device=str(device_id))
+        self.session = None
         self.serial_connection = serial_connection
+        self.serial_engine = None
         self.worker_thread = None
+        self.oil_probe = None
+        self.oil_probe_dialog = None
+        self.process_controller = None
+        self.process_views = {}
+        self.after_cool = None
 
 
                 
                         
 
         
-        self.testingLogoutButton.setIcon(QIcon("Assets/Images/logoutIcon.png"))
+        self.testingLogoutButton.setIcon(QIcon(asset_path("logoutIcon.png")))
         self.testingLogoutButton.setIconSize(QSize(40,40))
         
         # self.testingStopButton.setEnabled(False)
@@ -389,54 +3198,53 @@ class MainPageUI(QMainWindow):
         self.reportsButton.clicked.connect(self.openReportsPopup)
 
         self.load_logo()
-        self.serial_reader_thread = None
+
+        # density and viscosity are not measured yet; their card values seed the model
+        self.measurements = MeasurementModel({
+            "Density": to_number(self.densityCardLabel.text()),
+            "Viscosity": to_number(self.viscosityCardLabel.text()),
+            "Tandelta": to_number(self.tandelta2CardLabel.text()),
+            "WearDebris": to_number(self.wearDebrisCardLabel.text())
+        })
+        self.card_versions = {}
+        self.card_timer = QTimer(self)
+        self.card_timer.setInterval(int(1000 / SETTINGS["display"]["maxFps"]))
+        self.card_timer.timeout.connect(self.refresh_cards)
+
+        self.trends = {}
+        self.trends_changed = False
+        if SETTINGS["trends"]["enabled"]:
+            self.setup_trends()
+
+    def paintEvent(self, event):
+        paint_cover(self, 'homePage.png')
+        super(MainPageUI, self).paintEvent(event)
 
     def load_logo(self):
-        pixmap = QPixmap('Assets/Images/xymaLogoWhite.png')  
-        resized_pixmap = pixmap.scaled(150, 75, aspectRatioMode=1) 
-        
-        pixmap2 = QPixmap('Assets/Images/ioclRound.png')  
-        resized_pixmap2 = pixmap2.scaled(75, 75, aspectRatioMode=1) 
-        
-        pixmap3 = QPixmap('Assets/Images/densityIcon.png')
-        resized_pixmap3 = pixmap3.scaled(130, 130, aspectRatioMode=1) 
-        
-        pixmap4 = QPixmap('Assets/Images/viscosityIcon.png')
-        resized_pixmap4 = pixmap4.scaled(130, 130, aspectRatioMode=1) 
-        
-        pixmap5 = QPixmap('Assets/Images/tempIcon.png')
-        resized_pixmap5 = pixmap5.scaled(130, 130, aspectRatioMode=1) 
-        
-        pixmap7 = QPixmap('Assets/Images/tandeltaIcon2.png')
-        resized_pixmap7 = pixmap7.scaled(130, 130, aspectRatioMode=1) 
-        
-        pixmap8 = QPixmap('Assets/Images/wearDebrisIcon.png')
-        resized_pixmap8 = pixmap8.scaled(130, 130, aspectRatioMode=1) 
-    
-        self.XymaLogoLabel.setPixmap(resized_pixmap)
+        self.XymaLogoLabel.setPixmap(cached_pixmap('xymaLogoWhite.png', 150, 75))
         self.XymaLogoLabel.setScaledContents(False)
         self.XymaLogoLabel.setAlignment(Qt.AlignCenter)
         
-        self.IoclLogoLabel.setPixmap(resized_pixmap2)
+        self.IoclLogoLabel.setPixmap(cached_pixmap('ioclRound.png', 75, 75))
         self.IoclLogoLabel.setScaledContents(False)
     
-        self.densityCardIconLabel.setPixmap(resized_pixmap3)
+        self.densityCardIconLabel.setPixmap(cached_pixmap('densityIcon.png', 130, 130))
         self.densityCardIconLabel.setScaledContents(False)
         self.densityCardIconLabel.setAlignment(Qt.AlignCenter)
         
-        self.viscosityCardIconLabel.setPixmap(resized_pixmap4)
+        self.viscosityCardIconLabel.setPixmap(cached_pixmap('viscosityIcon.png', 130, 130))
         self.viscosityCardIconLabel.setScaledContents(False)
         self.viscosityCardIconLabel.setAlignment(Qt.AlignCenter)
         
-        # self.temperatureCardIconLabel.setPixmap(resized_pixmap5)
+        # self.temperatureCardIconLabel.setPixmap(cached_pixmap('tempIcon.png', 130, 130))
         # self.temperatureCardIconLabel.setScaledContents(False)
         # self.temperatureCardIconLabel.setAlignment(Qt.AlignCenter)
         
-        self.tandelta2CardIconLabel.setPixmap(resized_pixmap7)
+        self.tandelta2CardIconLabel.setPixmap(cached_pixmap('tandeltaIcon2.png', 130, 130))
         self.tandelta2CardIconLabel.setScaledContents(False)
         self.tandelta2CardIconLabel.setAlignment(Qt.AlignCenter)
         
-        self.wearDebrisCardIconLabel.setPixmap(resized_pixmap8)
+        self.wearDebrisCardIconLabel.setPixmap(cached_pixmap('wearDebrisIcon.png', 130, 130))
         self.wearDebrisCardIconLabel.setScaledContents(False)
         self.wearDebrisCardIconLabel.setAlignment(Qt.AlignCenter)
         
@@ -445,19 +3253,32 @@ class MainPageUI(QMainWindow):
 
 
 
+    def set_serial_engine(self, serial_connection, serial_engine):
+        self.serial_connection = serial_connection
+        self.serial_engine = serial_engine
+        processSettings = SETTINGS["process"]
+        self.process_controller = ProcessController(serial_engine,
+                                                    poll_interval_ms=processSettings["pollIntervalMs"],
+                                                    command_timeout_ms=processSettings["commandTimeoutMs"],
+                                                    drain_timeout_ms=processSettings["drainTimeoutMs"],
+                                                    fill_timeout_ms=processSettings["fillTimeoutMs"],
+                                                    cool_timeout_ms=processSettings["coolTimeoutMs"],
+                                                    confirm_timeout_ms=processSettings["confirmTimeoutMs"],
+                                                    cool_below=processSettings["coolBelow"],
+                                                    max_temperature=processSettings["maxTemperature"],
+                                                    parent=self)
+        self.process_controller.stage.connect(self.handle_process_stage)
+        self.process_controller.reading.connect(self.handle_process_reading)
+        self.process_controller.finished.connect(self.handle_process_finished)
+        self.process_controller.failed.connect(self.handle_process_failed)
+
     def openReportsPopup(self):
-        try:
-            with open("fluidData.json", "r") as file:
-                data = json.load(file)
-                
-                if not data:
-                    QMessageBox.warning(self, "No Data Available", 'Fluid entry is empty!')
-                else:
-                    dialog = ReportsPopup(self, collection = self.collection)
-                    dialog.exec_()
-                    
-        except (FileNotFoundError, json.JSONDecodeError):
-            print('Error reading the JSON file or the file is empty')
+        if self.fluid_registry.is_empty():
+            QMessageBox.warning(self, "No Data Available", 'Fluid entry is empty!')
+        else:
+            dialog = ReportsPopup(self, collection = self.collection, fluid_registry = self.fluid_registry,
+                                  archive = self.mainUI.archive, report_cache = self.mainUI.report_cache)
+            dialog.exec_()
            
     def logout(self): 
        self.send_empty_string()
@@ -469,200 +3290,251 @@ class MainPageUI(QMainWindow):
 
 
     def send_string_format(self):
-        global fluid_name
         if self.worker_thread:
                 self.worker_thread.stop()
-  
- 
-        if self.serial_connection:
-            for _ in range(4):  # Loop to read data three times
-                if self.serial_connection.in_waiting > 0:
-                    serialData = self.serial_connection.readline().decode('utf-8').strip()
-                    print("Garbage Values =", serialData)         
-
-        while(True):
-            time.sleep(1)
-            data = "3"
-            self.serial_connection.write(data.encode())
-            if self.serial_connection and self.serial_connection.in_waiting > 0:
-                serialData = self.serial_connection.readline().decode('utf-8').strip()
-                print("oil status =",serialData)
-              
-                values = serialData.split(',')
-                second_data = values[0].strip()
-                if second_data == "1": 
-                    print("yesss")
-                    break
-                    # msg_box = QMessageBox()
-                    # msg_box.setWindowTitle("Oil Status")
-                    # msg_box.setText("Oil is detected. Do you want to proceed?")
-                    # msg_box.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
-                    # msg_box.setWindowFlags(msg_box.windowFlags() & ~Qt.WindowCloseButtonHint)
-
-                    # response = msg_box.exec_()
-
-                    # if response == QMessageBox.Yes:
-                    #     try:
-                    #         with open("fluidData.json", 'r') as file:
-                    #             data = json.load(file)
-                    #             lastData = data[-1] if data else None
-                    #             fluid_name = lastData
-                    #             print('last json data',  lastData)
-                    #     except FileNotFoundError:
-                    #         print("The file does not exist.")
-                    #     except json.JSONDecodeError:
-                    #         print("Error decoding JSON.")
-
-                    #     print("User chose Yes.")
-                    #     # Perform action for "Yes"
-                    #     self.worker_thread = WorkerThread(self.serial_connection)
-                    #     self.worker_thread.data_received.connect(self.handle_received_data)
-                    #     self.worker_thread.finished.connect(self.handle_thread_finished)
-                    #     self.worker_thread.start()
-                    #     break
-                    # else:
-                    #     print("User chose No.")
-                    #     data = "3"
-                    #     self.serial_connection.write(data.encode())
-                    #     if self.serial_connection and self.serial_connection.in_waiting > 0:
-                    #         serialData = self.serial_connection.readline().decode('utf-8').strip()
-                    #         print("oil status",serialData)
-                        
-                    #         values = serialData.split(',')
-                    #         second_data = values[2].strip()
-                    #         print("response data =",second_data)
-                          
-                    #         if(float(second_data) >50):
-                    #             print("above 50")
-                    #             data = "7"
-                    #             self.serial_connection.write(data.encode())
-                    #             time.sleep(1)
-                    #             while(True):
-                    #                 data = "3"
-                    #                 self.serial_connection.write(data.encode())
-                    #                 if self.serial_connection and self.serial_connection.in_waiting > 0:
-                    #                     serialData = self.serial_connection.readline().decode('utf-8').strip()
-                    #                     values = serialData.split(',')
-                    #                     second_data = values[2].strip()
-                    #                     if(float(second_data) < 50):
-                    #                         data = "8"
-                    #                         self.serial_connection.write(data.encode())
-                    #                         break
-
-                            # else:
-                            #     print("oil draining process-----")
-                            #     self.serial_connection.write(data.encode())
-                            #     self.message_box = QMessageBox(self)
-                            #     self.message_box.setWindowTitle("Alert")
-                            #     self.message_box.setText("Oil is Draining, Please Wait!!")
-                            #     self.message_box.setStandardButtons(QMessageBox.Ok)
-
-                            #     self.message_box.show()
-                            #     data = "1"
-                            #     self.serial_connection.write(data.encode())
-                            #     if self.serial_connection and self.serial_connection.in_waiting > 0:
-                            #             serialData = self.serial_connection.readline().decode('utf-8').strip()
-                            #             self.message_box.close
-                            #             break
-                                
-                elif second_data == "0":
-                    print("no oil and oil filling process====") 
-                    break     
-                    # if self.serial_connection:
-                    #     dialog = StartButtonPopup(self, collection=self.collection)
-                    #     if dialog.exec_() == QDialog.Accepted:
-                    #         data = "0"
-                    #         self.serial_connection.write(data.encode())
-                    #         self.message_box = QMessageBox(self)
-                    #         self.message_box.setWindowTitle("Alert")
-                    #         self.message_box.setText("Oil is being filled, Please wait!")
-                    #         self.message_box.setStandardButtons(QMessageBox.Ok)
-                    #         self.message_box.show()
-
-                    #         if  self.serial_connection.in_waiting > 0:
-                    #             serialData = self.serial_connection.readline().decode('utf-8').strip()
-                    #             print("after waiting response==",serialData)
-                    #             QTimer.singleShot(1000, self.message_box.close)  # Close after 1 second
-                    #             self.worker_thread = WorkerThread(self.serial_connection)
-                    #             self.worker_thread.data_received.connect(self.handle_received_data)
-                    #             self.worker_thread.finished.connect(self.handle_thread_finished)
-                    #             self.worker_thread.start()
-                    #             break
-     
-
-
-    def handle_received_data(self, data):
-        values = data.split(',')
-        tantelta = values[1].strip()
-        Wear_debris = values[4].strip()
-        try:
-            Wear_debris = f"{float(Wear_debris):.2f}"  
-            tantelta = f"{float(tantelta):.2f}"
-        except ValueError:
-            Wear_debris = "N/A"
-            tantelta = "N/A"
-        self.wearDebrisCardLabel.setText(Wear_debris)
-        self.tandelta2CardLabel.setText(tantelta)
-
-
-        # fluid_name = self.fluidNameTextbox.text()
-        timestamp_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-       
-      
-        entry = f"{fluid_name}-{selectedTemperature}"
-
-
-
-        # selva code
-
-
-
-
 
+        if not self.serial_connection:
+            print('Serial connection not established')
+            return
+
+        if self.oil_probe and self.oil_probe.is_running():
+            return
+
+        probeSettings = SETTINGS["oilProbe"]
+        self.oil_probe = OilStatusProbe(self.serial_engine,
+                                        poll_interval_ms=probeSettings["pollIntervalMs"],
+                                        timeout_ms=probeSettings["timeoutMs"],
+                                        max_retries=probeSettings["maxRetries"],
+                                        parent=self)
+        # a probe can take timeoutMs x maxRetries, so it is shown and can be cancelled
+        self.oil_probe_dialog = QProgressDialog("Reading the oil status...", "Cancel", 0,
+                                                probeSettings["timeoutMs"] * probeSettings["maxRetries"], self)
+        self.oil_probe_dialog.setWindowTitle("Oil Status")
+        self.oil_probe_dialog.setWindowFlags(self.oil_probe_dialog.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.oil_probe_dialog.setMinimumDuration(0)
+        self.oil_probe_dialog.setAutoClose(False)
+        self.oil_probe_dialog.setAutoReset(False)
+        self.oil_probe_dialog.canceled.connect(self.oil_probe.cancel)
+        self.oil_probe.progress.connect(self.handle_oil_probe_progress)
+        self.oil_probe.oil_status.connect(self.close_oil_probe_dialog)
+        self.oil_probe.failed.connect(self.close_oil_probe_dialog)
+        self.oil_probe.oil_status.connect(self.handle_oil_status)
+        self.oil_probe.failed.connect(self.handle_oil_probe_failed)
+        self.oil_probe_dialog.setWindowModality(Qt.WindowModal)
+        self.oil_probe_dialog.show()
+        self.oil_probe.start()
+
+    def handle_oil_probe_progress(self, attempt, elapsed, serialData):
+        timeout = SETTINGS["oilProbe"]["timeoutMs"]
+        self.oil_probe_dialog.setLabelText(f"Reading the oil status (attempt {attempt} of {SETTINGS['oilProbe']['maxRetries']})...")
+        self.oil_probe_dialog.setValue(min((attempt - 1) * timeout + elapsed, self.oil_probe_dialog.maximum()))
+
+    def close_oil_probe_dialog(self):
+        # disconnected first so closing the dialog does not count as a cancel
+        self.oil_probe_dialog.canceled.disconnect(self.oil_probe.cancel)
+        self.oil_probe_dialog.close()
+
+    def handle_oil_probe_failed(self, message):
+        print("oil status probe failed:", message)
+        QMessageBox.warning(self, 'Oil Status', f'Could not read the oil status from the analyser!\n{message}')
+
+    def handle_oil_status(self, second_data):
+        if second_data == "1":
+            log_event(logging.INFO, "oil.present", device=self.device_id)
+            msg_box = QMessageBox(self)
+            msg_box.setWindowTitle("Oil Status")
+            msg_box.setText("Oil is detected. Do you want to proceed?")
+            msg_box.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+            msg_box.setWindowFlags(msg_box.windowFlags() & ~Qt.WindowCloseButtonHint)
+
+            if msg_box.exec_() == QMessageBox.Yes:
+                # carry on with the fluid already in this analyser's cell, never another rig's latest entry
+                if self.session is None:
+                    lastData = self.fluid_registry.cell(self.device_id)
+                    if lastData is None:
+                        QMessageBox.warning(self, 'No Fluid Entry', 'There is no fluid entry to continue, please drain and fill the cell!')
+                        return
+                    self.session = TestSession.from_key(lastData, device_id=self.device_id)
+                self.start_worker_thread()
+            else:
+                # hot oil is cooled below the limit before it is drained
+                self.after_cool = self.process_controller.start_drain
+                self.start_process(self.process_controller.start_cool)
 
+        elif second_data == "0":
+            print("no oil and oil filling process====")
+            dialog = StartButtonPopup(self, collection=self.collection, fluid_registry=self.fluid_registry)
+            if dialog.exec_() == QDialog.Accepted:
+                self.start_process(self.process_controller.start_fill)
 
+    def start_process(self, start):
+        if self.worker_thread:
+            self.worker_thread.stop()
+        if not start():
+            QMessageBox.warning(self, 'Busy', 'Another drain, fill or cooling process is still running!')
+
+    def process_view(self, cycle):
+        # built on first use, most sessions never drain or fill
+        if cycle not in self.process_views:
+            if cycle == CYCLE_COOL:
+                view = ProcessDialog('Cooling', self)
+                view.controller = self.process_controller
+            else:
+                view = ProcessScreen("Assets/UiFiles/oilDrainPage.ui" if cycle == CYCLE_DRAIN else "Assets/UiFiles/oilFillPage.ui", self)
+                view.abortButton.clicked.connect(self.process_controller.abort)
+            self.process_views[cycle] = view
+        return self.process_views[cycle]
+
+    def handle_process_stage(self, cycle, message):
+        view = self.process_view(cycle)
+        view.label.setText(message)
+        if isinstance(view, ProcessScreen):
+            view.cover(self)
+        elif not view.isVisible():
+            view.open()
+
+    def handle_process_reading(self, cycle, status, temperature):
+        if cycle == CYCLE_COOL:
+            self.process_view(cycle).label.setText(f"Cooling the oil below {SETTINGS['process']['coolBelow']:g} °C\nOil temperature: {temperature:.1f} °C")
+
+    def handle_process_finished(self, cycle, result):
+        log_event(logging.INFO, "process.finished", device=self.device_id, cycle=cycle, result=result)
+        self.close_process_view(cycle)
+        if cycle == CYCLE_COOL and self.after_cool:
+            after_cool, self.after_cool = self.after_cool, None
+            after_cool()
+        elif cycle == CYCLE_FILL:
+            self.start_worker_thread()
+        elif cycle == CYCLE_DRAIN:
+            self.session = None
+            self.fluid_registry.clear_cell(self.device_id)
+
+    def handle_process_failed(self, cycle, reason):
+        self.after_cool = None
+        self.close_process_view(cycle)
+        QMessageBox.warning(self, 'Process Stopped', f'The {cycle} process was stopped: {reason}')
+
+    def close_process_view(self, cycle):
+        view = self.process_views.get(cycle)
+        if view:
+            view.hide()
+
+    def resizeEvent(self, event):
+        super(MainPageUI, self).resizeEvent(event)
+        for view in self.process_views.values():
+            if isinstance(view, ProcessScreen) and view.isVisible():
+                view.cover(self)
+
+    def handle_received_data(self, frames):
+        # the cards are repainted by refresh_cards from the measurement model; every frame is stored here
+        started = time.perf_counter()
+        self.append_trends(frames)
+
+        if self.session is None:
+            return
+        density = self.measurements.get("Density")
+        viscosity = self.measurements.get("Viscosity")
+        for reading in self.session.readings(frames, density, viscosity):
+            self.save_reading(reading)
+        if self.column_writer:
+            self.column_writer.submit(self.session, frames, density, viscosity)
+
+        self.block_latency.observe(time.perf_counter() - started)
 
-        if '-' in fluid_name:
-            dbEntry = {
-                "FluidName": fluid_name,
-                "Density": self.densityCardLabel.text(),
-                "Viscosity": self.viscosityCardLabel.text(),
-                # "Temperature": self.parent.temperatureCardLabel.text(),
-                "Tandelta": self.tandelta2CardLabel.text(),
-                "WearDebris": self.wearDebrisCardLabel.text(),
-                "Timestamp": timestamp_str
-            }
-            
-            try:
-                self.collection.insert_one(dbEntry)
-                print("successfuly saved...!")
+  
 
-            except ServerSelectionTimeoutError:
-                QMessageBox.warning(self, 'Database Connection Error', 'Failed to connect to the MongoDB server!')
-                return
+    def setup_trends(self):
+        try:
+            import pyqtgraph as pg
+        except ImportError:
+            print('pyqtgraph is not installed, trend charts are disabled')
+            return
+
+        # the panel PCs have no GPU: software rendering, no antialiasing
+        pg.setConfigOptions(useOpenGL=False, antialias=False)
+        trendSettings = SETTINGS["trends"]
+        for field, frameName in CARD_TREND_FRAMES.items():
+            plot = pg.PlotWidget(axisItems={'bottom': pg.DateAxisItem()})
+            plot.setBackground(None)
+            plot.setStyleSheet("background: transparent;")
+            plot.setMinimumHeight(trendSettings["height"])
+            for axis in ('left', 'bottom'):
+                plot.getAxis(axis).setPen('w')
+                plot.getAxis(axis).setTextPen('w')
+            plot.setMouseEnabled(x=False, y=False)
+            plot.hideButtons()
+            plot.setMenuEnabled(False)
+            curve = plot.plot(pen=pg.mkPen('w', width=1))
+            getattr(self, frameName).layout().addWidget(plot)
+            self.trends[field] = (TrendBuffer(trendSettings["capacity"]), curve)
+
+    def append_trends(self, frames):
+        if not self.trends:
+            return
+
+        times = frames["timestamp"]
+        blockValues = {
+            "Tandelta": frames["tandelta"],
+            "WearDebris": frames["wearDebris"]
+        }
+        for field, (buffer, _) in self.trends.items():
+            values = blockValues.get(field)
+            if values is None:
+                value = self.measurements.get(field)
+                values = np.full(len(times), np.nan if value is None else value)
+            buffer.extend(times, values)
+        self.trends_changed = True
+
+    def refresh_trends(self):
+        if not self.trends_changed:
+            return
+        self.trends_changed = False
+
+        max_points = SETTINGS["trends"]["maxPoints"]
+        for buffer, curve in self.trends.values():
+            times, values = buffer.ordered()
+            times, values = decimate_minmax(times, values, max_points)
+            curve.setData(times, values, connect='finite')
+
+    def refresh_cards(self):
+        self.refresh_trends()
+        values, versions = self.measurements.snapshot()
+        for field, labelName in CARD_LABELS.items():
+            if versions.get(field, 0) == self.card_versions.get(field, 0):
+                continue
+            self.card_versions[field] = versions[field]
+
+            value = values.get(field)
+            text = "N/A" if value is None else f"{value:.2f}"
+            label = getattr(self, labelName)
+            if label.text() != text:
+                label.setText(text)
+
+    def save_reading(self, reading):
+        # queued for the background writer; the GUI thread never waits on MongoDB
+        if self.mongo_writer:
+            self.mongo_writer.submit(reading)
         else:
-            dbEntry = {
-                "FluidName": entry,
-                "Density": self.densityCardLabel.text(),
-                "Viscosity": self.viscosityCardLabel.text(),
-                # "Temperature": self.parent.temperatureCardLabel.text(),
-                "Tandelta": self.tandelta2CardLabel.text(),
-                "WearDebris": self.wearDebrisCardLabel.text(),
-                "Timestamp": timestamp_str
-            }
-            
-            try:
-                self.collection.insert_one(dbEntry)
-                print("successfuly saved...!")
-            except ServerSelectionTimeoutError:
-                QMessageBox.warning(self, 'Database Connection Error', 'Failed to connect to the MongoDB server!')
-                return
-
-       
+            print("Database connection is not available.")
 
-  
+    def start_worker_thread(self):
+        if self.worker_thread:
+            self.worker_thread.stop()
+        self.worker_thread = WorkerThread(self.serial_engine,
+                                          poll_interval=SETTINGS["serial"]["statusIntervalMs"] / 1000,
+                                          refresh_interval=SETTINGS["display"]["refreshIntervalMs"] / 1000,
+                                          measurements=self.measurements)
+        self.worker_thread.frames_received.connect(self.handle_received_data)
+        self.worker_thread.finished.connect(self.handle_thread_finished)
+        self.worker_thread.start()
+        self.card_timer.start()
 
     def handle_thread_finished(self):
+        # a replaced worker finishes after its successor has started; only the current one stops the refresh
+        if self.sender() is not self.worker_thread:
+            return
+        self.card_timer.stop()
+        self.refresh_cards()
         print("Thread finished")     
              
 
@@ -671,7 +3543,10 @@ class MainPageUI(QMainWindow):
             data = "2"
             self.stop_requested = True 
             print(f"String format sent: {data}")
-            self.serial_connection.write(data.encode())
+            if self.process_controller and self.process_controller.is_running():
+                self.after_cool = None
+                self.process_controller.abort()
+            self.serial_engine.submit(data, priority=PRIORITY_STOP, expects_reply=False, cancel_lower=True)
             if self.worker_thread:
                 self.worker_thread.stop()
         else:
@@ -679,33 +3554,21 @@ class MainPageUI(QMainWindow):
 
     def drain_fun(self):
         if self.serial_connection:
-            for _ in range(3):  # Loop to read data three times
-                if self.serial_connection.in_waiting > 0:
-                    serialData = self.serial_connection.readline().decode('utf-8').strip()
-                    print("Garbage Values =", serialData)         
-
-            data = "1"
-            self.stop_requested = True 
-            self.serial_connection.write(data.encode())
-            self.message_box = QMessageBox(self)
-            self.message_box.setWindowTitle("Alert")
-            self.message_box.setText("Oil is Draining, Please Wait!!")
-            self.message_box.setStandardButtons(QMessageBox.Ok)
-
-            self.message_box.show()
-            
-
-            if self.serial_connection.in_waiting > 0:
-                    serialData = self.serial_connection.readline().decode('utf-8').strip()
-                    print("After --",serialData)
-                    QTimer.singleShot(1000, self.message_box.close)  # Close after 1 second
-                    if self.worker_thread:
-                        self.worker_thread.stop()
+            self.after_cool = None
+            self.start_process(self.process_controller.start_drain)
         else:
             print('Serial connection not established')
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    import argparse
+    parser = argparse.ArgumentParser(description="IOCL analyser software")
+    parser.add_argument("--port", action="append", help="open this port or pyserial URL instead of searching for USB adapters (repeatable)")
+    args, qtArgs = parser.parse_known_args()
+    if args.port:
+        SETTINGS["serial"]["ports"] = args.port
+    logging.basicConfig(level=SETTINGS["logging"]["level"], format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    app = QApplication(sys.argv[:1] + qtArgs)
     ui = MainUI() 
     ui.show()
     sys.exit(app.exec_())
\ No newline at end of file
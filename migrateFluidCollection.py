@@ -0,0 +1,62 @@
+# converts readings saved as display strings ("0.45", "N/A", "2024-05-01 10:00:00")
+# into doubles/datetimes and creates the (FluidName, Timestamp) index.
+# usage: python migrateFluidCollection.py [--uri mongodb://localhost:27017] [--batch-size 1000] [--dry-run]
+import argparse
+from datetime import datetime
+
+from pymongo import MongoClient, UpdateOne
+
+from mainFile import MEASUREMENT_FIELDS, TIMESTAMP_FORMAT, to_number, prepare_fluid_collection
+
+
+def convert_document(document):
+    changes = {}
+    for field in MEASUREMENT_FIELDS:
+        if isinstance(document.get(field), str):
+            changes[field] = to_number(document[field])
+
+    timestamp = document.get("Timestamp")
+    if isinstance(timestamp, str):
+        try:
+            changes["Timestamp"] = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+        except ValueError:
+            print(f"Skipping unreadable Timestamp {timestamp!r} on {document['_id']}")
+    return changes
+
+
+def migrate(collection, batch_size=1000, dry_run=False):
+    string_fields = [{field: {"$type": "string"}} for field in MEASUREMENT_FIELDS + ("Timestamp",)]
+    cursor = collection.find({"$or": string_fields}).batch_size(batch_size)
+
+    operations = []
+    converted = 0
+    for document in cursor:
+        changes = convert_document(document)
+        if not changes:
+            continue
+        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": changes}))
+        if len(operations) >= batch_size:
+            converted += flush(collection, operations, dry_run)
+            operations = []
+    converted += flush(collection, operations, dry_run)
+    return converted
+
+
+def flush(collection, operations, dry_run):
+    if operations and not dry_run:
+        collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert fluidCollection readings to native types")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+    collection = prepare_fluid_collection(client['IOCLDatabase'])
+    converted = migrate(collection, args.batch_size, args.dry_run)
+    print(f"{'Would convert' if args.dry_run else 'Converted'} {converted} documents")
+    client.close()
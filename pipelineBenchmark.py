@@ -0,0 +1,280 @@
+# headless benchmark of the acquisition-to-storage pipeline: virtual analysers (serialSimulator) feed the real
+# MainUI/SerialEngine/WorkerThread/MongoWriter path, mongomock stands in for the server unless --mongo-uri is given.
+# results go to a JSON file so runs from different versions can be compared.
+# usage: python pipelineBenchmark.py [--analysers 2] [--duration 10] [--export-sizes 10000 1000000] [--output results.json]
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PyQt5.QtCore import QObject, QEvent, QTimer, QElapsedTimer, Qt
+from PyQt5.QtWidgets import QApplication
+
+import mainFile
+from serialSimulator import VirtualAnalyser
+
+
+def percentiles(samples, scale=1000.0):
+    if not samples:
+        return None
+    values = np.asarray(samples) * scale
+    return {"count": len(values), "p50": round(float(np.percentile(values, 50)), 3),
+            "p90": round(float(np.percentile(values, 90)), 3), "p99": round(float(np.percentile(values, 99)), 3),
+            "max": round(float(values.max()), 3)}
+
+
+# forwards everything to the real collection and notes when each document's insert was acknowledged
+class TimedCollection:
+    def __init__(self, collection, latencies):
+        self.collection = collection
+        self.latencies = latencies
+
+    def insert_many(self, documents, *args, **kwargs):
+        result = self.collection.insert_many(documents, *args, **kwargs)
+        acked = time.time()
+        self.latencies.extend(acked - document["Timestamp"].timestamp() for document in documents)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class PaintProbe(QObject):
+    def __init__(self, arrived, latencies):
+        super(PaintProbe, self).__init__()
+        self.arrived = arrived
+        self.latencies = latencies
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint and self.arrived:
+            painted = time.time()
+            self.latencies.extend(painted - arrival for arrival in self.arrived)
+            self.arrived.clear()
+        return False
+
+
+# measures how late a 10 ms timer fires: anything beyond the interval is time the GUI thread was busy
+class StallProbe(QObject):
+    def __init__(self, interval=10):
+        super(StallProbe, self).__init__()
+        self.interval = interval
+        self.stalls = []
+        self.clock = QElapsedTimer()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+
+    def start(self):
+        self.clock.start()
+        self.timer.start(self.interval)
+
+    def tick(self):
+        self.stalls.append(max(0, self.clock.restart() - self.interval) / 1000)
+
+    def summary(self):
+        result = percentiles(self.stalls) or {}
+        result["over50msCount"] = sum(1 for stall in self.stalls if stall > 0.05)
+        result["totalMs"] = round(sum(self.stalls) * 1000, 1)
+        return result
+
+
+# MainUI always opens IOCLDatabase; against a real server every database lookup is sent to IOCLBenchmark instead
+class BenchmarkClient:
+    def __init__(self, client):
+        self.client = client
+
+    def __getitem__(self, name):
+        return self.client["IOCLBenchmark"]
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def make_client(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        return MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("mongomock is not installed: pip install mongomock, or pass --mongo-uri")
+    return mongomock.MongoClient()
+
+
+def run_for(app, ms):
+    QTimer.singleShot(ms, app.quit)
+    app.exec_()
+
+
+def benchmark_pipeline(app, client, args):
+    serialSettings = mainFile.SETTINGS["serial"]
+    serialSettings["statusIntervalMs"] = args.poll_ms
+    serialSettings["maxInFlight"] = args.in_flight
+    serialSettings["frameFormat"] = args.frame_format
+
+    analysers = [VirtualAnalyser(binary=args.frame_format != "csv", latency=args.latency_ms / 1000, seed=index)
+                 for index in range(args.analysers)]
+    serialSettings["ports"] = [analyser.start() for analyser in analysers]
+
+    mainFile.MongoClient = lambda *a, **k: BenchmarkClient(client)
+    insertLatencies = []
+    paintLatencies = []
+    ui = mainFile.MainUI()
+    run_for(app, 1500)  # database and ports come up in the background
+    ui.mongo_writer.collection = TimedCollection(ui.mongo_writer.collection, insertLatencies)
+    ui.stackedWidget.setCurrentWidget(ui.ensure_main_page())
+    ui.show()
+
+    probes = []
+    for index, rig in enumerate(ui.analysers):
+        page = rig.page
+        page.session = mainFile.TestSession(f"benchmark{index}", 40, device_id=page.device_id)
+        arrived = []
+        handle = page.handle_received_data
+
+        # wrapped before start_worker_thread connects it, so every block that reaches the page is timestamped
+        def handle_received_data(frames, handle=handle, arrived=arrived):
+            arrived.extend(frames["timestamp"].tolist())
+            handle(frames)
+
+        page.handle_received_data = handle_received_data
+        probe = PaintProbe(arrived, paintLatencies)
+        page.tandelta2CardLabel.installEventFilter(probe)
+        probes.append(probe)
+        page.start_worker_thread()
+
+    stallProbe = StallProbe()
+    stallProbe.start()
+    writtenBefore = ui.mongo_writer.stats()["written"]
+    started = time.monotonic()
+    run_for(app, int(args.duration * 1000))
+    elapsed = time.monotonic() - started
+    stats = ui.mongo_writer.stats()
+
+    for rig in ui.analysers:
+        rig.page.send_empty_string()
+    run_for(app, 300)
+    ui.close()
+    for analyser in analysers:
+        analyser.stop()
+
+    return {
+        "analysers": args.analysers,
+        "durationS": round(elapsed, 2),
+        "framesPerSec": round((stats["written"] - writtenBefore) / elapsed, 1),
+        "framesPerSecPerAnalyser": round((stats["written"] - writtenBefore) / elapsed / max(1, args.analysers), 1),
+        "serialToInsertAckMs": percentiles(insertLatencies),
+        "serialToCardPaintMs": percentiles(paintLatencies),
+        "eventLoopStallMs": stallProbe.summary(),
+        "writer": stats,
+    }
+
+
+def seed_documents(collection, count, batch=10000):
+    collection.delete_many({})
+    start = datetime(2024, 1, 1)
+    rng = np.random.default_rng(0)
+    for offset in range(0, count, batch):
+        size = min(batch, count - offset)
+        values = rng.random((size, 4))
+        collection.insert_many([{"FluidName": "benchmark-40", "Density": float(row[0]), "Viscosity": float(row[1]),
+                                 "Tandelta": float(row[2]), "WearDebris": float(row[3]),
+                                 "Timestamp": start + timedelta(seconds=offset + index)}
+                                for index, row in enumerate(values)])
+
+
+def benchmark_exports(client, sizes, formats):
+    collection = mainFile.prepare_fluid_collection(client["IOCLBenchmark"])
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            seed_documents(collection, size)
+            for fileFormat in formats:
+                path = os.path.join(directory, f"report.{fileFormat}")
+                thread = mainFile.ReportExportThread(collection, mainFile.report_query("benchmark-40"), path, fileFormat,
+                                                     batch_size=mainFile.SETTINGS["reports"]["batchSize"])
+                outcome = {}
+                thread.completed.connect(lambda file_path, rows: outcome.update(rows=rows), Qt.DirectConnection)
+                thread.failed.connect(lambda message: outcome.update(error=message), Qt.DirectConnection)
+
+                tracemalloc.start()
+                started = time.perf_counter()
+                thread.start()
+                thread.wait()
+                seconds = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                result = {"documents": size, "format": fileFormat, "seconds": round(seconds, 3),
+                          "docsPerSec": round(size / seconds, 1), "peakPythonMemoryMb": round(peak / 2 ** 20, 2),
+                          "fileMb": round(os.path.getsize(path) / 2 ** 20, 2) if os.path.exists(path) else None}
+                result.update(outcome)
+                print(f"Export {size} documents to {fileFormat}: {result}")
+                results.append(result)
+        collection.drop()
+    return results
+
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the acquisition-to-storage pipeline")
+    parser.add_argument("--analysers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of sustained acquisition")
+    parser.add_argument("--poll-ms", type=int, default=1, help="status poll interval per analyser")
+    parser.add_argument("--in-flight", type=int, default=4, help="pipelined status requests per analyser")
+    parser.add_argument("--frame-format", choices=("csv", "binary"), default="csv")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated analyser reply latency")
+    parser.add_argument("--export-sizes", type=int, nargs="*", default=[10000, 1000000])
+    parser.add_argument("--export-formats", nargs="*", default=["csv", "xlsx"])
+    parser.add_argument("--mongo-uri", help="use a real server instead of mongomock")
+    parser.add_argument("--output", default="benchmarkResults.json")
+    args = parser.parse_args()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    # the benchmark must not pick up (or add to) the readings of a real installation
+    workDirectory = tempfile.mkdtemp(prefix="iocl-benchmark-")
+    mainFile.SETTINGS["spool"]["directory"] = os.path.join(workDirectory, "spool")
+    mainFile.SETTINGS["fluidRegistry"]["path"] = os.path.join(workDirectory, "fluidData.db")
+    mainFile.SETTINGS["columnStore"]["directory"] = os.path.join(workDirectory, "readings")
+    mainFile.SETTINGS["reportCache"]["directory"] = os.path.join(workDirectory, "reportCache")
+
+    app = QApplication(sys.argv[:1])
+    client = make_client(args.mongo_uri)
+
+    results = {
+        "version": git_version(),
+        "createdAt": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": "mongodb" if args.mongo_uri else "mongomock",
+        "settings": vars(args),
+        "pipeline": benchmark_pipeline(app, client, args),
+        "export": benchmark_exports(client, args.export_sizes, args.export_formats),
+    }
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=4)
+    print(json.dumps(results["pipeline"], indent=4))
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
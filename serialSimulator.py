@@ -0,0 +1,271 @@
+# virtual analyser on a pseudo terminal, for running the app and load tests without hardware (Linux/macOS).
+# it speaks the analyser protocol: "3" status frame, "0" fill, "1" drain, "2" stop, "7"/"8" cooling on/off,
+# "B" binary frames (with --binary), and can inject garbage lines, fragmented or truncated frames, stalls and drops.
+# usage: python serialSimulator.py [--count 2] [--launch] [--garbage-rate 0.05] [--stall-rate 0.01] ...
+#        python serialSimulator.py --replay capture.csv --speed 10
+#        python serialSimulator.py --record capture.csv --port /dev/ttyUSB0 --frames 600
+import argparse
+import csv
+import os
+import random
+import select
+import subprocess
+import sys
+import threading
+import time
+import tty
+
+from mainFile import BINARY_SYNC, BINARY_FRAME
+
+
+def load_capture(path):
+    with open(path, "r", newline="") as file:
+        return [(float(elapsed), frame) for elapsed, frame in csv.reader(file)]
+
+
+class VirtualAnalyser:
+    def __init__(self, oil=True, temperature=45.0, ambient=30.0, latency=0.0, fill_time=2.0, drain_time=2.0,
+                 binary=False, garbage_rate=0.0, partial_rate=0.0, truncate_rate=0.0, stall_rate=0.0,
+                 stall_time=2.0, drop_rate=0.0, replay=None, speed=1.0, seed=None):
+        self.oil = oil
+        self.temperature = temperature
+        self.setpoint = temperature
+        self.ambient = ambient
+        self.cooling = False
+        self.latency = latency
+        self.fill_time = fill_time
+        self.drain_time = drain_time
+        self.binary = binary
+        self.binary_mode = False
+        self.garbage_rate = garbage_rate
+        self.partial_rate = partial_rate
+        self.truncate_rate = truncate_rate
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.drop_rate = drop_rate
+        self.replay = replay or []
+        self.speed = speed
+        self.random = random.Random(seed)
+
+        self.master = None
+        self.slave = None
+        self.port_name = None
+        self.running = False
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.last_update = time.monotonic()
+        self.replay_index = 0
+        self.replay_started = None
+        self.stats = {"commands": 0, "frames": 0, "garbage": 0, "partial": 0, "truncated": 0, "stalls": 0, "dropped": 0}
+
+    def start(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port_name = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self.port_name
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def serve(self):
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 256)
+            except OSError:
+                return
+            for command in data.decode("ascii", errors="ignore"):
+                self.stats["commands"] += 1
+                self.handle(command)
+
+    def handle(self, command):
+        if command == "3":
+            self.send_status()
+        elif command == "0":
+            self.later(self.fill_time, self.finish_fill)
+        elif command == "1":
+            self.later(self.drain_time, self.finish_drain)
+        elif command == "7":
+            self.cooling = True
+        elif command == "8":
+            self.cooling = False
+        elif command == "B" and self.binary:
+            self.binary_mode = True
+            self.write(b"BIN\n")
+        # "2" (stop) and the cooler commands have no reply
+
+    def later(self, delay, action):
+        timer = threading.Timer(delay, action)
+        timer.daemon = True
+        timer.start()
+
+    def finish_fill(self):
+        self.oil = True
+        self.write(b"OK\n")
+
+    def finish_drain(self):
+        self.oil = False
+        self.write(b"OK\n")
+
+    def update_temperature(self):
+        # cooling pulls the oil towards ambient, otherwise the heater brings it back to the setpoint
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.last_update = now
+        if self.cooling:
+            self.temperature = max(self.ambient, self.temperature - 2.0 * elapsed)
+        else:
+            self.temperature = min(self.setpoint, self.temperature + 0.5 * elapsed)
+
+    def next_frame(self):
+        if self.replay:
+            if self.replay_started is None:
+                self.replay_started = time.monotonic() - self.replay[0][0] / self.speed
+            elapsed, frame = self.replay[self.replay_index % len(self.replay)]
+            loops = self.replay_index // len(self.replay)
+            self.replay_index += 1
+            # frames are handed out no faster than the capture ran, sped up by --speed
+            due = self.replay_started + (elapsed + loops * self.replay[-1][0]) / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            return frame
+
+        self.update_temperature()
+        status = 1 if self.oil else 0
+        tandelta = self.random.uniform(0.2, 0.8) if self.oil else 0.0
+        wear_debris = self.random.uniform(0.0, 10.0) if self.oil else 0.0
+        return f"{status},{tandelta:.3f},{self.temperature:.2f},0,{wear_debris:.3f}"
+
+    def send_status(self):
+        roll = self.random.random
+        if roll() < self.drop_rate:
+            self.stats["dropped"] += 1
+            return
+        if roll() < self.stall_rate:
+            self.stats["stalls"] += 1
+            time.sleep(self.stall_time)
+        if self.latency:
+            time.sleep(self.latency)
+        if roll() < self.garbage_rate:
+            self.stats["garbage"] += 1
+            self.write(bytes(self.random.randrange(32, 127) for _ in range(self.random.randrange(1, 40))) + b"\n")
+
+        frame = self.next_frame()
+        if self.binary_mode:
+            values = [float(value) for value in frame.split(",")]
+            # packed with the decoder's own layout; the checksum covers everything between sync and checksum
+            fields = (int(values[0]), *values[1:5])
+            checksum = sum(BINARY_FRAME.pack(BINARY_SYNC, *fields, 0)[len(BINARY_SYNC):-2]) & 0xFFFF
+            payload = BINARY_FRAME.pack(BINARY_SYNC, *fields, checksum)
+        else:
+            payload = (frame + "\n").encode()
+
+        if roll() < self.truncate_rate:
+            self.stats["truncated"] += 1
+            payload = payload[:self.random.randrange(1, len(payload))] + (b"" if self.binary_mode else b"\n")
+        elif roll() < self.partial_rate:
+            # the same frame, delivered in two reads
+            self.stats["partial"] += 1
+            split = self.random.randrange(1, len(payload))
+            self.write(payload[:split])
+            time.sleep(0.01)
+            payload = payload[split:]
+
+        self.stats["frames"] += 1
+        self.write(payload)
+
+    def write(self, data):
+        with self.write_lock:
+            try:
+                os.write(self.master, data)
+            except OSError:
+                pass
+
+
+def record(port, output, frames, interval):
+    import serial
+
+    connection = serial.serial_for_url(port, 9600, timeout=1.0)
+    started = time.monotonic()
+    with open(output, "w", newline="") as file:
+        writer = csv.writer(file)
+        for _ in range(frames):
+            connection.write(b"3")
+            frame = connection.readline().decode("utf-8", errors="replace").strip()
+            if frame:
+                writer.writerow([f"{time.monotonic() - started:.3f}", frame])
+            time.sleep(interval)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual analyser for testing without hardware")
+    parser.add_argument("--count", type=int, default=1, help="number of virtual analysers")
+    parser.add_argument("--no-oil", action="store_true", help="start with the cell empty")
+    parser.add_argument("--temperature", type=float, default=45.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="reply delay for every status frame")
+    parser.add_argument("--binary", action="store_true", help="acknowledge the binary frame request")
+    parser.add_argument("--garbage-rate", type=float, default=0.0, help="chance of a garbage line before a frame")
+    parser.add_argument("--partial-rate", type=float, default=0.0, help="chance of a frame arriving in two pieces")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="chance of a frame being cut short")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="chance of the analyser going quiet")
+    parser.add_argument("--stall-ms", type=float, default=2000.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="chance of a status request getting no reply")
+    parser.add_argument("--replay", help="answer status requests from a recorded capture")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--launch", action="store_true", help="start the application on the virtual ports")
+    parser.add_argument("--record", metavar="OUTPUT", help="record a capture from --port instead of simulating")
+    parser.add_argument("--port", help="analyser to record from")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--interval-ms", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    if args.record:
+        if not args.port:
+            parser.error("--record needs --port")
+        record(args.port, args.record, args.frames, args.interval_ms / 1000)
+        return
+
+    replay = load_capture(args.replay) if args.replay else None
+    analysers = [VirtualAnalyser(oil=not args.no_oil, temperature=args.temperature, latency=args.latency_ms / 1000,
+                                 binary=args.binary, garbage_rate=args.garbage_rate, partial_rate=args.partial_rate,
+                                 truncate_rate=args.truncate_rate, stall_rate=args.stall_rate,
+                                 stall_time=args.stall_ms / 1000, drop_rate=args.drop_rate, replay=replay,
+                                 speed=args.speed, seed=None if args.seed is None else args.seed + index)
+                 for index in range(args.count)]
+    ports = [analyser.start() for analyser in analysers]
+    for port in ports:
+        print(f"Virtual analyser on {port}")
+
+    try:
+        if args.launch:
+            command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mainFile.py")]
+            for port in ports:
+                command += ["--port", port]
+            subprocess.call(command)
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for analyser in analysers:
+            print(f"{analyser.port_name}: {analyser.stats}")
+            analyser.stop()
+
+
+if __name__ == "__main__":
+    main()
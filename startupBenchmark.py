@@ -0,0 +1,97 @@
+# measures time-to-interactive: from launching the interpreter until the login page first paints.
+# every run is a fresh process so imports, .ui loading and window setup are all counted.
+# usage: python startupBenchmark.py [--runs 5] [--budget-ms 1000] [--offscreen]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def child():
+    started = time.perf_counter()
+
+    from PyQt5.QtCore import QObject, QEvent, QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv)
+    import mainFile
+    imported = time.perf_counter()
+
+    def report():
+        painted = time.perf_counter()
+        print(json.dumps({"importMs": round((imported - started) * 1000, 1),
+                          "constructMs": round((constructed - imported) * 1000, 1),
+                          "paintMs": round((painted - constructed) * 1000, 1)}), flush=True)
+        # skip the normal shutdown, the background tasks may still be waiting on the database
+        os._exit(0)
+
+    # the report is queued from the first paint event so it runs once that paint has finished
+    class FirstPaint(QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Paint:
+                QTimer.singleShot(0, report)
+            return False
+
+    firstPaint = FirstPaint()
+    ui = mainFile.MainUI()
+    ui.loginPage.installEventFilter(firstPaint)
+    constructed = time.perf_counter()
+    ui.show()
+    app.exec_()
+
+
+def measure(offscreen):
+    env = dict(os.environ)
+    if offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+
+    launched = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child"],
+                               stdout=subprocess.PIPE, env=env, text=True)
+    for line in process.stdout:
+        if line.startswith("{"):
+            result = json.loads(line)
+            result["totalMs"] = round((time.perf_counter() - launched) * 1000, 1)
+            break
+    else:
+        result = None
+    process.kill()
+    process.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure application time-to-interactive")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000)
+    parser.add_argument("--offscreen", action="store_true", help="use the offscreen Qt platform (no display needed)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    runs = []
+    for run in range(args.runs):
+        result = measure(args.offscreen)
+        if result is None:
+            print(f"Run {run + 1}: the window never painted")
+            sys.exit(1)
+        print(f"Run {run + 1}: {result}")
+        runs.append(result)
+
+    # the first run also compiles the .ui cache, so it is reported but left out of the median
+    warm = runs[1:] or runs
+    median = statistics.median(run["totalMs"] for run in warm)
+    print(f"Median time-to-interactive: {median:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    sys.exit(0 if median <= args.budget_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import numpy as np
+import pytest
+
+from mainFile import (FluidArchive, MEASUREMENT_FIELDS, SUMMARY_COLUMNS, TIMESTAMP_FORMAT, floor_time,
+                      merge_summaries, prepare_fluid_collection, report_query, rollup_buckets)
+from migrateFluidCollection import convert_document
+
+# mongomock applies the minute tier's TTL index against the real clock, so the tests run at the current hour
+NOW = floor_time(datetime.now(), 3600)
+DAYS = 5
+
+
+def reading(fluid, timestamp, value=1.0):
+    document = {"FluidName": fluid, "Timestamp": timestamp}
+    document.update({field: value for field in MEASUREMENT_FIELDS})
+    return document
+
+
+@pytest.fixture
+def archive():
+    db = mongomock.MongoClient()["IOCLTest"]
+    raw = prepare_fluid_collection(db)
+    start = NOW - timedelta(days=DAYS)
+    raw.insert_many([reading("oil-40", start + timedelta(minutes=10 * step), float(step % 7))
+                     for step in range(DAYS * 24 * 6)])
+    archive = FluidArchive(db, raw, compact_after_days=1, raw_retention_days=3, minute_retention_days=2, chunk_hours=24)
+    archive.prepare()
+    return archive
+
+
+def test_no_ttl_on_raw_readings(archive):
+    assert "Timestamp_ttl" not in archive.raw.index_information()
+    assert "Timestamp_ttl" in archive.tiers["minute"].index_information()
+
+
+def test_interrupted_compaction_keeps_uncompacted_readings(archive):
+    chunks = iter(range(1))
+    archive.compact(now=NOW, should_stop=lambda: next(chunks, None) is None)
+    since, until = archive.compacted_window()
+
+    assert (since, until) == (NOW - timedelta(days=5), NOW - timedelta(days=4))
+    # the day before until is past rawRetentionDays but not rolled up yet, so it stays
+    assert archive.raw.find_one({}, sort=[("Timestamp", 1)])["Timestamp"] == until
+    assert archive.raw.count_documents({}) == 4 * 24 * 6
+    assert sum(hour["Readings"] for hour in archive.tiers["hour"].find()) == 24 * 6
+
+
+def test_compaction_expires_raw_readings_once_rolled_up(archive):
+    archive.compact(now=NOW)
+    since, until = archive.compacted_window()
+
+    assert (since, until) == (NOW - timedelta(days=5), NOW - timedelta(days=1))
+    assert archive.raw.find_one({}, sort=[("Timestamp", 1)])["Timestamp"] == NOW - timedelta(days=3)
+    assert archive.raw.count_documents({}) == 3 * 24 * 6
+    assert sum(hour["Readings"] for hour in archive.tiers["hour"].find()) == 4 * 24 * 6
+
+
+def test_legacy_string_timestamps(archive):
+    legacy = NOW - timedelta(days=DAYS + 2)
+    archive.raw.insert_many([{"FluidName": "old-40", "Density": "0.9", "Viscosity": "N/A", "Tandelta": "0.1",
+                              "WearDebris": "2", "Timestamp": (legacy + timedelta(minutes=step)).strftime(TIMESTAMP_FORMAT)}
+                             for step in range(30)])
+
+    # strings sort before dates; compaction starts at the first date and leaves the strings alone
+    archive.compact(now=NOW)
+    since, _ = archive.compacted_window()
+    assert since == NOW - timedelta(days=DAYS)
+    assert archive.raw.count_documents({"Timestamp": {"$type": "string"}}) == 30
+
+    for document in archive.raw.find({"Timestamp": {"$type": "string"}}):
+        archive.raw.update_one({"_id": document["_id"]}, {"$set": convert_document(document)})
+
+    # converted readings land before the window and are rolled up before they can expire
+    archive.compact(now=NOW)
+    since, _ = archive.compacted_window()
+    assert since == floor_time(legacy, 3600)
+    hours = list(archive.tiers["hour"].find({"FluidName": "old-40"}))
+    assert sum(hour["Readings"] for hour in hours) == 30
+    assert hours[0]["DensityMean"] == pytest.approx(0.9)
+    assert hours[0]["ViscosityMean"] is None
+
+
+def parts(sources):
+    return [(collection.name, query.get("Timestamp", {}).get("$gte"), query.get("Timestamp", {}).get("$lt"))
+            for collection, query, _ in sources]
+
+
+@pytest.mark.parametrize("interval", [None, 60, 3600, "summary"])
+def test_report_sources_per_interval(archive, interval):
+    archive.compact(now=NOW)
+    since, until = archive.compacted_window()
+    raw_from = NOW - timedelta(days=3)
+    minute_from = NOW - timedelta(days=2)
+
+    expected = {
+        # raw readings wherever they are kept, the hour tier where they have expired
+        None: [("fluidCollection", None, since), ("fluidArchiveHour", since, raw_from), ("fluidCollection", raw_from, None)],
+        # the minute tier where it is kept, raw and hour rows around it
+        60: [("fluidCollection", None, since), ("fluidArchiveHour", since, raw_from),
+             ("fluidCollection", raw_from, minute_from), ("fluidArchiveMinute", minute_from, until),
+             ("fluidCollection", until, None)],
+        3600: [("fluidCollection", None, since), ("fluidArchiveHour", since, until), ("fluidCollection", until, None)],
+        "summary": [("fluidCollection", None, since), ("fluidArchiveHour", since, raw_from),
+                    ("fluidCollection", raw_from, None)]
+    }
+    assert parts(archive.report_sources(report_query("oil-40"), interval, now=NOW)) == expected[interval]
+
+
+def test_report_sources_before_first_compaction(archive):
+    query = report_query("oil-40", NOW - timedelta(days=4), NOW)
+    assert parts(archive.report_sources(query, 3600, now=NOW)) == [("fluidCollection", NOW - timedelta(days=4), NOW)]
+
+
+def test_rollup_buckets_weights_means_by_readings():
+    start = datetime(2026, 1, 1, 10)
+    minutes = [dict(FluidName="oil-40", Timestamp=start + timedelta(minutes=step), Readings=readings,
+                    **{f"{field}{stat}": value for field in MEASUREMENT_FIELDS
+                       for stat, value in (("Min", low), ("Max", high), ("Mean", mean))})
+               for step, readings, low, high, mean in ((0, 1, 1.0, 1.0, 1.0), (1, 3, 2.0, 6.0, 5.0), (70, 2, 0.0, 9.0, 4.0))]
+    hours = sorted(rollup_buckets(minutes, 3600), key=lambda hour: hour["Timestamp"])
+
+    assert [hour["Timestamp"] for hour in hours] == [start, start + timedelta(hours=1)]
+    assert hours[0]["Readings"] == 4
+    assert hours[0]["DensityMin"] == 1.0 and hours[0]["DensityMax"] == 6.0
+    assert hours[0]["DensityMean"] == pytest.approx((1.0 + 3 * 5.0) / 4)
+    assert hours[1]["DensityMean"] == 4.0
+
+
+def summary_row(values, start, std=True):
+    row = {"FluidName": "oil-40", "Readings": len(values), "From": start, "To": start + timedelta(seconds=len(values))}
+    for field in MEASUREMENT_FIELDS:
+        row.update({f"{field}Min": values.min(), f"{field}Max": values.max(), f"{field}Mean": values.mean(),
+                    f"{field}Std": values.std(ddof=1) if std and len(values) > 1 else None,
+                    f"{field}Count": len(values)})
+    return row
+
+
+def test_merge_summaries_pools_mean_and_std():
+    generator = np.random.default_rng(7)
+    blocks = [generator.normal(10, 2, size) for size in (5, 1, 40)]
+    start = datetime(2026, 1, 1)
+    rows = [summary_row(values, start + timedelta(days=day)) for day, values in enumerate(blocks)]
+    everything = np.concatenate(blocks)
+
+    (merged,) = merge_summaries(iter(rows))
+    assert list(merged) == list(SUMMARY_COLUMNS)
+    assert merged["Readings"] == len(everything)
+    assert merged["From"] == start and merged["To"] == start + timedelta(days=2, seconds=40)
+    assert merged["DensityMin"] == everything.min() and merged["DensityMax"] == everything.max()
+    assert merged["DensityMean"] == pytest.approx(everything.mean())
+    assert merged["DensityStd"] == pytest.approx(everything.std(ddof=1))
+
+
+def test_merge_summaries_leaves_std_empty_with_a_tier_part():
+    generator = np.random.default_rng(3)
+    tier, recent = generator.normal(5, 1, 30), generator.normal(6, 1, 20)
+    start = datetime(2026, 1, 1)
+    (merged,) = merge_summaries(iter([summary_row(tier, start, std=False), summary_row(recent, start + timedelta(days=1))]))
+
+    assert merged["DensityMean"] == pytest.approx(np.concatenate([tier, recent]).mean())
+    assert merged["DensityStd"] is None
+
+
+def test_merge_summaries_single_and_empty():
+    row = summary_row(np.array([1.0, 2.0, 4.0]), datetime(2026, 1, 1))
+    (merged,) = merge_summaries(iter([row]))
+    assert merged["DensityStd"] == row["DensityStd"]
+    assert "DensityCount" not in merged
+    assert list(merge_summaries(iter([]))) == []
+
+
+def test_merge_summaries_skips_fields_without_readings():
+    start = datetime(2026, 1, 1)
+    empty = summary_row(np.array([1.0, 3.0]), start)
+    empty.update({"DensityMin": None, "DensityMax": None, "DensityMean": None, "DensityStd": None, "DensityCount": 0})
+    full = summary_row(np.array([5.0, 7.0]), start + timedelta(days=1))
+    (merged,) = merge_summaries(iter([empty, full]))
+
+    assert merged["DensityMean"] == 6.0 and merged["DensityMin"] == 5.0
+    assert merged["ViscosityMean"] == 4.0
+    assert merged["DensityStd"] == pytest.approx(full["DensityStd"])
@@ -0,0 +1,133 @@
+import csv
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from PyQt5.QtCore import Qt
+
+from mainFile import (MEASUREMENT_FIELDS, TIMESTAMP_FORMAT, ReportCache, ReportExportThread, prepare_fluid_collection,
+                      report_query)
+
+START = datetime.now().replace(microsecond=0) - timedelta(hours=2)
+
+
+def reading(timestamp, value):
+    document = {"FluidName": "oil-40", "Timestamp": timestamp, "DeviceId": "dev-1"}
+    document.update({field: value for field in MEASUREMENT_FIELDS})
+    return document
+
+
+@pytest.fixture
+def raw():
+    collection = prepare_fluid_collection(mongomock.MongoClient()["IOCLTest"])
+    collection.insert_many([reading(START + timedelta(seconds=10 * step), float(step)) for step in range(300)])
+    return collection
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ReportCache(str(tmp_path / "cache"), check_window=timedelta(days=7))
+
+
+def read_report(path, file_format):
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pylist()
+    with open(path, newline="") as file:
+        return list(csv.reader(file))
+
+
+# runs the export on the calling thread and returns (rows written, report contents)
+def export(raw, path, file_format="csv", cache=None, query=None):
+    query = query or report_query("oil-40")
+    thread = ReportExportThread(raw, query, str(path), file_format, batch_size=64, cache=cache,
+                                plan=lambda part: [(raw, part, None)])
+    results, failures = [], []
+    thread.completed.connect(lambda _, written: results.append(written), Qt.DirectConnection)
+    # raising inside a slot aborts PyQt, so failures are only checked once run() is back
+    thread.failed.connect(failures.append, Qt.DirectConnection)
+    thread.run()
+    assert failures == []
+    return results[0], read_report(path, file_format) if results[0] else None
+
+
+def outcomes(cache):
+    return {outcome: counter.value for outcome, counter in cache.outcomes.items()}
+
+
+def changed(cache, before):
+    return {outcome: value - before[outcome] for outcome, value in outcomes(cache).items() if value != before[outcome]}
+
+
+@pytest.fixture(params=["csv", "parquet"])
+def file_format(request):
+    if request.param == "parquet":
+        pytest.importorskip("pyarrow")
+    return request.param
+
+
+def test_second_download_reuses_the_kept_file(raw, cache, tmp_path, file_format):
+    before = outcomes(cache)
+    written, first = export(raw, tmp_path / f"first.{file_format}", file_format, cache)
+    assert written == 300
+    assert changed(cache, before) == {"miss": 1}
+
+    before = outcomes(cache)
+    written, second = export(raw, tmp_path / f"second.{file_format}", file_format, cache)
+    assert written == 300
+    assert second == first
+    assert changed(cache, before) == {"hit": 1}
+    assert export(raw, tmp_path / f"plain.{file_format}", file_format)[1] == first
+
+
+def test_new_readings_are_appended_to_the_cached_rows(raw, cache, tmp_path, file_format):
+    export(raw, tmp_path / f"first.{file_format}", file_format, cache)
+    raw.insert_many([reading(START + timedelta(seconds=3000 + step), -1.0) for step in range(25)])
+
+    before = outcomes(cache)
+    written, refreshed = export(raw, tmp_path / f"refreshed.{file_format}", file_format, cache)
+    assert written == 325
+    assert changed(cache, before) == {"refresh": 1}
+    assert refreshed == export(raw, tmp_path / f"plain.{file_format}", file_format)[1]
+
+    # the refreshed rows are final now, so the next download is a hit again
+    before = outcomes(cache)
+    assert export(raw, tmp_path / f"again.{file_format}", file_format, cache)[1] == refreshed
+    assert changed(cache, before) == {"hit": 1}
+
+
+def test_late_reading_behind_the_mark_rebuilds_the_entry(raw, cache, tmp_path):
+    export(raw, tmp_path / "first.csv", "csv", cache)
+    # e.g. replayed from a spool after the report was cached
+    raw.insert_one(reading(START + timedelta(seconds=15), 99.0))
+
+    before = outcomes(cache)
+    written, rebuilt = export(raw, tmp_path / "rebuilt.csv", "csv", cache)
+    assert written == 301
+    assert changed(cache, before) == {"miss": 1}
+    assert rebuilt == export(raw, tmp_path / "plain.csv", "csv")[1]
+
+
+def test_bounded_report_is_cached_up_to_its_end(raw, cache, tmp_path):
+    query = report_query("oil-40", START + timedelta(minutes=10), START + timedelta(minutes=20))
+    written, first = export(raw, tmp_path / "first.csv", "csv", cache, query)
+    assert written == 60
+    # readings after the end do not touch the report
+    raw.insert_one(reading(START + timedelta(hours=1), 5.0))
+
+    before = outcomes(cache)
+    assert export(raw, tmp_path / "second.csv", "csv", cache, query)[1] == first
+    assert changed(cache, before) == {"hit": 1}
+
+
+def test_legacy_string_timestamps_bypass_the_cache(raw, cache, tmp_path):
+    raw.insert_many([{"FluidName": "oil-40", "Density": "0.9", "Viscosity": "1.5", "Tandelta": "0.1", "WearDebris": "2",
+                      "Timestamp": (START - timedelta(days=30, seconds=step)).strftime(TIMESTAMP_FORMAT)}
+                     for step in range(10)])
+
+    before = outcomes(cache)
+    written, rows = export(raw, tmp_path / "legacy.csv", "csv", cache)
+    assert written == 310
+    assert sum(1 for row in rows if row[0] == "oil-40" and row[1] == "0.9") == 10
+    assert changed(cache, before) == {}
+    assert cache.entries == {}